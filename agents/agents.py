@@ -1,7 +1,6 @@
 from mesa.agent import Agent
-import helpers
 import numpy as np
-import globalVariables
+from eventLog import INFECT, CLEAN, DETECT
 
 
 class BetterAgent(Agent):
@@ -13,17 +12,19 @@ class BetterAgent(Agent):
 
 class User(BetterAgent):
 
-    def __init__(self, user_id, parent, model):
+    def __init__(self, user_id, parent, model, rng=None):
         super().__init__(model)
         self.user_id = user_id
         self.total_utility = 0
         self.communicate_to = []
         self.parent = parent
-        self.activity = max(0, min(1, globalVariables.RNG().normal(0.5, 1 / 6)))
+        # random stream of this user, the model's global stream unless common random numbers are used
+        self.rng = rng if rng is not None else model.rng
+        self.activity = max(0, min(1, self.rng().normal(0.5, 1 / 6)))
         self.model.users.append(self)  # append user into model's user list
 
     def is_active(self):
-        return globalVariables.RNG().random() < self.activity
+        return self.rng().random() < self.activity
 
     def step(self):
         super().step()
@@ -33,17 +34,17 @@ class User(BetterAgent):
 
 
 class Attacker(User):
-    def __init__(self, attacker_id, model):
-        super().__init__(attacker_id, model, model)
+    def __init__(self, attacker_id, model, rng=None):
+        super().__init__(attacker_id, model, model, rng)
         self.id = attacker_id
-        self.effectiveness = max(0.005, min(1, globalVariables.RNG().normal(0.5, 1/6)))
+        self.effectiveness = max(0.005, min(1, self.rng().normal(0.5, 1/6)))
         self.model = model
         self.predetermined_detection = np.zeros(self.model.num_firms, dtype=np.bool)
 
     def _generate_communicators(self):
         for org in self.model.organizations:
-            user = globalVariables.RNG().choice(org.users)
-            if globalVariables.RNG().random() < (1-self.effectiveness):
+            user = self.rng().choice(org.users)
+            if self.rng().random() < (1-self.effectiveness):
                 if not user.parent.attacks_compromised_counts[self.id]:
                     self.communicate_to.append(user)
 
@@ -62,7 +63,7 @@ class Attacker(User):
     def step(self):
         super().step()
         for i in range(self.predetermined_detection.shape[0]):
-            self.predetermined_detection[i] = self.model.organizations[i].users[0].detect(self, True)
+            self.predetermined_detection[i] = self.model.organizations[i].users[0].detect(self, True, self.rng)
         self._generate_communicators()
 
     def advance(self):
@@ -75,9 +76,9 @@ class Attacker(User):
 
 
 class Employee(User):
-    def __init__(self, user_id, parent, model):
-        super().__init__(user_id, parent, model)
-        self.compromisers = np.zeros(self.model.num_attackers, dtype=np.bool)
+    def __init__(self, user_id, parent, model, rng=None):
+        super().__init__(user_id, parent, model, rng)
+        self.compromisers = self.model.employee_compromisers[parent.id, user_id]  # row of the model's pool
         self.to_clean = []
 
     def is_compromised(self):
@@ -93,27 +94,34 @@ class Employee(User):
         self.parent.attacks_compromised_counts[attacker_id] -= 1
         if self.parent.attacks_compromised_counts[attacker_id] == 0:
             self.parent.attack_awareness[attacker_id] = False
+            self.model.incidents.close(self.parent.id, attacker_id, self.model.schedule.time)
 
-        if not self.is_compromised():  # if not compromised any more
+        cleaned = not self.is_compromised()
+        if cleaned:  # if not compromised any more
             self.model.total_compromised -= 1
             self.parent.num_compromised_new -= 1
             # self.parent.num_compromised -= 1
+        if self.model.event_log is not None:
+            self.model.event_log.record(CLEAN, self.parent.id, self.user_id, attacker_id, cleaned)
 
     def notify_infection(self, attacker):
         """
         Notifies this user that it has been infected.
         :param attacker: the attacker infecting this device
         """
-        if not self.is_compromised():
+        compromised = not self.is_compromised()
+        if compromised:
             self.model.total_compromised += 1
             self.parent.num_compromised_new += 1
             self.parent.num_compromised += 1
         self.parent.attacks_compromised_counts[attacker.id] += 1
         self.compromisers[attacker.id] = True
+        if self.model.event_log is not None:
+            self.model.event_log.record(INFECT, self.parent.id, self.user_id, attacker.id, compromised)
 
     def _generate_communicators(self):
         # generate list of users to talk with
-        user_id = globalVariables.RNG().choice(np.arange(1, self.model.device_count))  # for consistent randomness when branching
+        user_id = self.rng().choice(np.arange(1, self.model.device_count))  # for consistent randomness when branching
         if user_id <= self.id:
             user_id -= 1
 
@@ -142,7 +150,7 @@ class Employee(User):
         active = self.is_active()
         for c in self.communicate_to:
             for attacker in self.model.attackers:
-                detected = c.detect(attacker, False)
+                detected = c.detect(attacker, False, self.rng)  # drawn from this user's stream
                 if active and self.compromisers[attacker.id]:
                     if detected:
                         self.information_update(attacker.id)
@@ -154,32 +162,26 @@ class Employee(User):
         self.communicate_to.clear()
 
     def information_update(self, attacker_id):
-        while self.parent.attacks_list_predetermined_idx[attacker_id] < 1000:
-            next_bit = self.parent.attacks_list_predetermined[attacker_id,
-                                                              self.parent.attacks_list_predetermined_idx[attacker_id]]
-            if self.parent.new_attacks_list[attacker_id, next_bit]:
-                self.parent.attacks_list_predetermined_idx[attacker_id] += 1
-            else:
-                self.parent.new_attacks_list[attacker_id, next_bit] = True
-                self.parent.attacks_list_predetermined_idx[attacker_id] += 1
-                break
+        self.parent.learn_next_bit(attacker_id)
 
     def make_aware(self, attacker_id):
         self.parent.attack_awareness[attacker_id] = True
         self.parent.detection_counts[attacker_id] += 1
         self.parent.num_detects_new += 1
+        self.model.incidents.detect(self.parent.id, attacker_id, self.model.schedule.time)
+        if self.model.event_log is not None:
+            self.model.event_log.record(DETECT, self.parent.id, self.user_id, attacker_id)
 
-    def detect(self, attacker, targeted):
-        information = self.parent.get_info(attacker.id)
-        security = self.parent.security_budget
-        is_aware = self.parent.is_aware(attacker.id)
-        #print(information)
-        if not targeted and not is_aware:  # treats aware attacks as targeted attacks
-            aggregate_security = (security + information + security*information)
+    def detect(self, attacker, targeted, rng=None):
+        """
+        Returns whether this user detects an attack.
+        :param rng: random stream to draw from (this user's stream if None)
+        """
+        # the probabilities only depend on the organization, see OrganizationState.update_detection_probabilities
+        if targeted or self.parent.is_aware(attacker.id):  # treats aware attacks as targeted attacks
+            prob = self.model.detection_prob_targeted[self.parent.id, attacker.id]
         else:
-            aggregate_security = information + 0.001 + security*information
-
-        prob = helpers.get_prob_detection_v3(aggregate_security, attacker.effectiveness)
-        # print(security, information, attacker.effectiveness, prob)
-        return globalVariables.RNG().random() < prob  # attack is detected, gain information
-
+            prob = self.model.detection_prob_untargeted[self.parent.id, attacker.id]
+        if rng is None:
+            rng = self.rng
+        return rng().random() < prob  # attack is detected, gain information
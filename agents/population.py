@@ -0,0 +1,171 @@
+from agents.agents import BetterAgent
+from eventLog import INFECT, CLEAN, DETECT
+import numpy as np
+
+
+class EmployeePopulation(BetterAgent):
+    """
+    Mean-field replacement of the employees (and of the attackers' behavior) of every organization.
+
+    Instead of individual Employee objects, only the number of employees compromised by each attack in each
+    organization (attacks_compromised_counts) is tracked, with binomial transitions mirroring the agent engine:
+        - step: compromised employees of an organization aware of the attack detect it with the (targeted)
+          detection probability, gain information about it and are cleaned in the advance phase
+        - advance: every compromised employee is active with the organization's mean activity and contacts a
+          random coworker. The contact detects the attack (the employee gains information and is cleaned), or
+          the coworker gets infected if it wasn't already
+        - every active attacker targets a random employee of the organizations it hasn't compromised, with
+          probability 1 - effectiveness, and infects it unless the organization detects the attack
+    As in the agent engine (see Employee._generate_communicators), the coworkers are drawn among the first
+    device_count - 1 employees: the last employee of every organization is only reached by the attackers, so the
+    attacks compromising it are tracked apart (last_compromisers). Whether one of the other devices is compromised
+    by any attack is sampled assuming the attacks are independent.
+    The organizations, the sharing game and the reporters are unchanged. The event log gets aggregate events
+    (see eventLog.py) instead of per employee ones.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        n = model.num_firms
+        a = model.num_attackers
+        # mean activity of the employees of each organization, drawn as for individual employees
+        activity = np.clip(model.rng().normal(0.5, 1 / 6, size=(n, model.device_count)), 0, 1)
+        self.activity = activity.mean(axis=1)[:, None]
+        self.detected = np.zeros((n, a), dtype=np.int)  # employees detecting their own compromise this step
+        self.attacker_detected = np.zeros((n, a), dtype=np.bool)
+        self.attacker_targets = np.zeros((n, a), dtype=np.bool)
+        self.last_compromisers = np.zeros((n, a), dtype=np.bool)  # attacks compromising the last employee
+
+    def detection_probabilities(self):
+        """Probability for an employee to detect each attack (targeted when the organization is aware of it)."""
+        state = self.model.org_state
+        return np.where(state.attack_awareness, self.model.detection_prob_targeted,
+                        self.model.detection_prob_untargeted)
+
+    def step(self):
+        model = self.model
+        rng = model.rng()
+        state = model.org_state
+        counts = state.attacks_compromised_counts
+        aware = state.attack_awareness.copy()
+        self.detected = np.where(aware, rng.binomial(counts, model.detection_prob_targeted), 0)
+        self.make_aware(self.detected)
+
+        # attackers decide who to attack before the employees act
+        active = np.arange(model.num_attackers) < model.active_attacker_count
+        effectiveness = model.attacker_effectiveness[None, :]
+        self.attacker_detected = rng.random(counts.shape) < model.detection_prob_targeted
+        self.attacker_targets = active & (counts == 0) & (rng.random(counts.shape) < 1 - effectiveness)
+
+    def advance(self):
+        model = self.model
+        rng = model.rng()
+        state = model.org_state
+        self.clean(self.detected)
+
+        # compromised employees contacting a coworker: detected by the contact, or infecting it
+        counts = state.attacks_compromised_counts
+        p = self.detection_probabilities()
+        detected = rng.binomial(counts, self.activity * p)
+        remaining = np.maximum(1 - self.activity * p, 1e-12)
+        attempts = rng.binomial(counts - detected, np.clip(self.activity * (1 - p) / remaining, 0, 1))
+        self.make_aware(detected)
+        self.clean(detected)
+        # the coworkers are drawn among the reachable employees, the contacting one included
+        reachable = model.device_count - 1
+        susceptible = reachable - (state.attacks_compromised_counts - self.last_compromisers)
+        hit = 1 - (1 - 1 / max(reachable, 1)) ** attempts
+        self.infect(rng.binomial(susceptible, hit))
+
+        # attackers' attempts
+        for org_id, attacker_id in zip(*np.nonzero(self.attacker_targets & self.attacker_detected)):
+            model.organizations[org_id].learn_next_bit(attacker_id)
+        infected = self.attacker_targets & ~self.attacker_detected
+        self.infect(infected.astype(np.int), infected & (rng.random(infected.shape) < 1 / model.device_count))
+
+    def make_aware(self, detected):
+        """Detections of `detected[org, attack]` employees: information gain and awareness."""
+        state = self.model.org_state
+        for org_id, attacker_id in zip(*np.nonzero(detected)):
+            for _ in range(detected[org_id, attacker_id]):
+                self.model.organizations[org_id].learn_next_bit(attacker_id)
+        state.attack_awareness |= detected > 0
+        self.model.incidents.detect_many(detected, self.model.schedule.time)
+        self.record_counts(DETECT, detected)
+        state.detection_counts += detected
+        state.num_detects_new += detected.sum(axis=1)
+
+    def clean_probabilities(self):
+        """
+        Probability that a device compromised by an attack isn't compromised by any other attack (the last
+        employee's excepted).
+        """
+        reachable = self.model.org_state.attacks_compromised_counts - self.last_compromisers
+        fraction = reachable / max(self.model.device_count - 1, 1)
+        others = np.broadcast_to(1 - fraction[:, None, :], fraction.shape + fraction.shape[1:]).copy()
+        idx = np.arange(fraction.shape[1])
+        others[:, idx, idx] = 1
+        return np.clip(others.prod(axis=2), 0, 1)
+
+    def clean(self, cleaned):
+        state = self.model.org_state
+        rng = self.model.rng()
+        # the last employee is among the `cleaned` ones of the compromised employees with probability cleaned / counts
+        last = self.last_compromisers & (rng.random(cleaned.shape) * state.attacks_compromised_counts < cleaned)
+        devices = rng.binomial(cleaned - last, self.clean_probabilities()).sum(axis=1)
+        devices += self.update_last(last, False)
+        state.attacks_compromised_counts -= cleaned
+        self.record_counts(CLEAN, cleaned)
+        self.model.incidents.close_many(state.attack_awareness & (state.attacks_compromised_counts == 0),
+                                        self.model.schedule.time)
+        state.attack_awareness &= state.attacks_compromised_counts > 0
+        self.update_devices(-devices)
+
+    def infect(self, infected, last=None):
+        """
+        Infections of `infected[org, attack]` employees.
+        :param last: whether the last employee is among the infected ones (never if None)
+        """
+        state = self.model.org_state
+        if last is None:
+            last = np.zeros(infected.shape, dtype=np.bool)
+        devices = self.model.rng().binomial(infected - last, self.clean_probabilities()).sum(axis=1)
+        devices += self.update_last(last, True)
+        state.attacks_compromised_counts += infected
+        self.record_counts(INFECT, infected)
+        state.num_compromised += devices
+        self.update_devices(devices)
+
+    def update_last(self, changed, compromised):
+        """
+        Sets whether the last employee is compromised by the `changed[org, attack]` attacks.
+        :return: for every organization, 1 if the last employee's device changed state, else 0
+        """
+        before = self.last_compromisers.any(axis=1)
+        if compromised:
+            self.last_compromisers |= changed
+        else:
+            self.last_compromisers &= ~changed
+        return (before != self.last_compromisers.any(axis=1)).astype(np.int)
+
+    def update_devices(self, change):
+        state = self.model.org_state
+        reachable = state.attacks_compromised_counts - self.last_compromisers
+        last = self.last_compromisers.any(axis=1)
+        # a device count consistent with the per attack counts
+        new = np.clip(state.num_compromised_new + change, reachable.max(axis=1) + last,
+                      np.minimum(reachable.sum(axis=1), self.model.device_count - 1) + last)
+        change = new - state.num_compromised_new
+        self.model.total_compromised += int(change.sum())
+        state.num_compromised_new[:] = new
+        event_log = self.model.event_log
+        if event_log is not None:
+            for org_id in np.nonzero(change)[0]:
+                event_log.record(INFECT if change[org_id] > 0 else CLEAN, org_id, value=abs(change[org_id]))
+
+    def record_counts(self, kind, counts):
+        """Records counts[org, attack] infections, cleans or detections as aggregate events."""
+        event_log = self.model.event_log
+        if event_log is not None:
+            for org_id, attacker_id in zip(*np.nonzero(counts)):
+                event_log.record(kind, org_id, attacker=attacker_id, value=counts[org_id, attacker_id])
@@ -1,94 +1,359 @@
+from mesa.time import SimultaneousActivation
 from agents.agents import *
+import helpers
 import numpy as np
-import globalVariables
+from eventLog import SECURITY, KNOWLEDGE
 
 
-class Organization(BetterAgent):
-    def __init__(self, org_id, model):
-        super().__init__(model)
+def _statistic(compute):
+    """
+    Statistic of every organization computed from the running sums of OrganizationState when read, and cached
+    until the next step (zero before the first step).
+    """
+    name = compute.__name__
+
+    def get(self):
+        value = self.statistics.get(name)
+        if value is None:
+            if self.elapsed == 0:
+                value = np.zeros(len(self.security_budget))
+            else:
+                value = compute(self)
+            self.statistics[name] = value
+        return value
+    return property(get)
+
+
+class OrganizationState:
+    """
+    State of all organizations, stored as model-wide arrays with one row per organization.
+
+    Organization objects are thin views over their row (see Organization), kept for the employees, reporters
+    and the visualization. The per-step bookkeeping of every organization is done at once by `step` and
+    `advance`, called by BatchedOrganizationActivation.
+    """
+
+    def __init__(self, model):
+        n = model.num_firms
+        a = model.num_attackers
 
-        self.id = org_id
-        self.users = []
-        self.old_utility = 0
-        self.utility = 0
         # dictionary storing attack and known information about it, row = attack, column = info
-        self.old_attacks_list = np.zeros((self.model.num_attackers, 1000), dtype=np.bool)
+        self.old_attacks_list = np.zeros((n, a, 1000), dtype=np.bool)
         # updated dictionary storing attack and known information about it, row = attack, column = info
-        self.new_attacks_list = np.zeros((self.model.num_attackers, 1000), dtype=np.bool)
-
+        self.new_attacks_list = np.zeros((n, a, 1000), dtype=np.bool)
         # for random seeding
-        self.attacks_list_predetermined = np.zeros((self.model.num_attackers, 1000), dtype=np.int)
-        self.attacks_list_predetermined_idx = np.zeros(self.model.num_attackers, dtype=np.int)
-        for i in range(self.model.num_attackers):
-            self.attacks_list_predetermined[i] = np.arange(1000)
-            globalVariables.RNG().shuffle(self.attacks_list_predetermined[i])
-
-        self.attacks_list_mean = np.zeros(self.model.num_attackers)
+        self.attacks_list_predetermined = np.zeros((n, a, 1000), dtype=np.int)
+        self.attacks_list_predetermined_idx = np.zeros((n, a), dtype=np.int)
+        self.attacks_list_mean = np.zeros((n, a))
+        # Knowledge changes: the bits (flat indices attack * 1000 + bit) set in new_attacks_list since the last
+        # advance are pending, and appended to the organization's log when committed to old_attacks_list.
+        # share_versions[i, j] is the length of i's log that i had transmitted to j at the last advance, so a
+        # repeated exchange only processes the bits i learned since then.
+        self.knowledge_counts = np.zeros((n, a), dtype=np.int)  # number of known bits per attack
+        self.knowledge_log = np.zeros((n, a * 1000), dtype=np.int)
+        self.knowledge_version = np.zeros(n, dtype=np.int)
+        self.pending_bits = [[] for _ in range(n)]
+        self.share_versions = np.zeros((n, n), dtype=np.int)
+        self.pending_share_versions = np.zeros((n, n), dtype=np.int)
         # to store attackers and number of devices compromised from organization
-        self.attacks_compromised_counts = np.zeros(self.model.num_attackers, dtype=np.int)
-        # self.org_out = np.zeros(len(model.organizations))
-        self.org_out = np.zeros(self.model.num_firms)  # store the amount of info shared with other organizations
-
-        # incident start, last update
-        self.attack_awareness = np.zeros(self.model.num_attackers, dtype=np.bool) # inc_start, last_update, num_detected, active
-        self.detection_counts = np.zeros(self.model.num_attackers, dtype=np.int)
-        self.security_budget = max(0.005, min(1, globalVariables.RNG().normal(0.5, 1 / 6)))
-        self.security_change = 0
-        self.num_detects_new = 0
-        # self.security_budget = 0.005
-        self.num_compromised_new = 0  # for getting avg rate of compromised per step
-        self.num_compromised_old = 0  # for getting avg rate of compromised per step
+        self.attacks_compromised_counts = np.zeros((n, a), dtype=np.int)
+        self.org_out = np.zeros((n, n))  # store the amount of info shared with other organizations
+        self.attack_awareness = np.zeros((n, a), dtype=np.bool)
+        self.detection_counts = np.zeros((n, a), dtype=np.int)
+
+        self.security_budget = np.zeros(n)
+        self.security_change = np.zeros(n)
+        self.security_drop = np.zeros(n)
+        self.num_detects_new = np.zeros(n, dtype=np.int)
+        self.num_compromised_new = np.zeros(n, dtype=np.int)  # for getting avg rate of compromised per step
+        self.num_compromised_old = np.zeros(n, dtype=np.int)  # for getting avg rate of compromised per step
+        self.utility = np.zeros(n)
+        self.info_in = np.zeros(n)  # total info gained
+        self.info_out = np.zeros(n)  # total info shared outside
+        self.count = 0  # steps since the last security update, the same for every organization
+
+        # <---- Data collection ---->
+        # running sums, the averages are statistics computed when read (see _statistic)
+        self.total_security = np.zeros(n)
+        self.newly_compromised_per_step_aggregated = np.zeros(n, dtype=np.int)
+        self.num_compromised = np.zeros(n, dtype=np.int)
+        self.time_with_incident = np.zeros(n, dtype=np.int)
+        self.total_share = np.zeros(n, dtype=np.int)
+        self.num_games_played = np.zeros(n, dtype=np.int)
+        # values at the last step of the inputs changing later in the step
+        self.elapsed = 0
+        self.active_attackers = 0
+        self.compromised_snapshot = np.zeros(n, dtype=np.int)
+        self.known_bits_snapshot = np.zeros(n, dtype=np.int)
+        self.statistics = {}  # statistics computed since the last step
+        self.incidents = None  # the model's IncidentLedger
+
+    def reset(self):
+        """Clears the state for a new run of the model, in place."""
+        for value in self.__dict__.values():
+            if isinstance(value, np.ndarray):
+                value.fill(0)
+        for pending in self.pending_bits:
+            del pending[:]
         self.count = 0
-        self.risk_of_sharing = 0.3  # TODO: parametrize, possibly update in update_utility_sharing or whatever
-        self.info_in = 0  # total info gained
-        self.info_out = 0  # total info shared outside
-        self.security_drop = min(1, max(0, globalVariables.RNG().normal(0.75, 0.05)))
-        self.acceptable_freeload = self.model.acceptable_freeload  # freeloading tolerance towards other organizations
-        self.unhandled_incidents = []
+        self.elapsed = 0
+        self.active_attackers = 0
+        self.statistics.clear()
+
+    def update_detection_probabilities(self, model):
+        """
+        Recomputes the model's detection probability tables. The probabilities only depend on the security
+        budgets and the known information, so this is called whenever either changes.
+        An attack an organization is aware of is detected like a targeted attack.
+        """
+        information = self.attacks_list_mean
+        security = self.security_budget[:, None]
+        untargeted_security = security + information + security * information
+        targeted_security = information + 0.001 + security * information
+        model.detection_prob_untargeted[:] = helpers.get_prob_detection_v3(untargeted_security,
+                                                                           model.attacker_effectiveness)
+        model.detection_prob_targeted[:] = helpers.get_prob_detection_v3(targeted_security,
+                                                                         model.attacker_effectiveness)
+
+    def update_budget(self, model):
+        total_detections = self.detection_counts.max(axis=1)
+        detected = total_detections > 0  # a security incident happened and wasn't handled in time
+        self.security_change[detected] += ((1 - self.security_budget[detected]) *
+                                           (total_detections[detected] / model.device_count))
+        self.security_budget += self.security_change
+        np.clip(self.security_budget, 0.005, 1.0, out=self.security_budget)
+        self.security_change[:] = 0
+        self.detection_counts[:] = 0
 
-        # create employees
-        for i in range(0, self.model.device_count):
-            self.users.append(Employee(i, self, self.model))
+    def step(self, model):
+        self.count += 1
+        # organizations update their security budget every n steps based on previous step utility in order to improve their utility
+        if self.count == model.security_update_interval:
+            self.count = 0
+            self.update_budget(model)
+            self.update_detection_probabilities(model)
+            if model.event_log is not None:
+                for org_id, budget in enumerate(self.security_budget):
+                    model.event_log.record(SECURITY, org_id, value=budget)
+        no_detects = self.num_detects_new == 0
+        self.security_change[no_detects] -= ((1 - self.security_drop[no_detects]) * self.security_budget[no_detects] /
+                                             model.security_update_interval)
+        self.num_detects_new[:] = 0
+
+        model.org_utility += self.utility.sum()  # adds organizations utility to model's utility of all organizations
+        model.total_org_utility += self.utility.sum()  # for the calculation of the average utility for the batchrunner
 
-        # <---- Data collection ---->
+        # for calculating the average NEWLY compromised per step
+        newly_compromised = self.num_compromised_new - self.num_compromised_old
+        model.newly_compromised_per_step.extend(newly_compromised.tolist())
+        self.newly_compromised_per_step_aggregated += newly_compromised  # Organization lvl
+        self.num_compromised_old[:] = self.num_compromised_new
+
+        # <-- updating the running sums of the statistics --->
+        self.total_security += self.security_budget
+        if model.num_attackers > 0:
+            self.time_with_incident += 1
+        self.elapsed = model.schedule.time + 1
+        self.active_attackers = model.active_attacker_count
+        self.compromised_snapshot[:] = self.num_compromised
+        self.known_bits_snapshot[:] = self.knowledge_version  # bits known about the (active) attacks
+        self.statistics.clear()
+
+    # <--- statistics, as of the last step --->
+    @_statistic
+    def free_loading_ratio(self):
+        return helpers.free_loading_ratio_v1(self.info_in, self.info_out)
+
+    @_statistic
+    def avg_security(self):
+        return self.total_security / self.elapsed
+
+    @_statistic
+    def avg_newly_compromised_per_step(self):
+        return self.newly_compromised_per_step_aggregated / self.elapsed
+
+    # average number of times shared when playing a game
+    @_statistic
+    def avg_share(self):
+        return self.total_share / np.maximum(self.num_games_played, 1)
+
+    # average information known about all attacks
+    @_statistic
+    def avg_info(self):
+        return self.known_bits_snapshot / (self.active_attackers * 1000)
+
+    @_statistic
+    def avg_time_with_incident(self):
+        return self.time_with_incident / self.elapsed
+
+    @_statistic
+    def avg_compromised_per_step(self):
+        return self.compromised_snapshot / self.elapsed
+
+    # average duration of the ended incidents (see IncidentLedger)
+    @_statistic
+    def avg_incident_times(self):
+        return self.incidents.mean_duration(self.elapsed, len(self.security_budget))
+
+    # fraction of the incidents that weren't handled in time
+    @_statistic
+    def avg_unhandled_incidents(self):
+        return self.incidents.unhandled_rate(self.elapsed, len(self.security_budget))
+
+    def advance(self, model):
+        # commit the pending bits, old_attacks_list becomes equal to new_attacks_list
+        for org_id, pending in enumerate(self.pending_bits):
+            if not pending:
+                continue
+            old = self.old_attacks_list[org_id].reshape(-1)
+            bits = np.unique(np.array(pending))
+            bits = bits[~old[bits]]
+            old[bits] = True
+            version = self.knowledge_version[org_id]
+            self.knowledge_log[org_id, version:version + len(bits)] = bits
+            self.knowledge_version[org_id] += len(bits)
+            self.knowledge_counts[org_id] += np.bincount(bits // 1000, minlength=model.num_attackers)
+            del pending[:]
+            if model.event_log is not None:
+                for attacker_id in np.unique(bits // 1000):
+                    model.event_log.record(KNOWLEDGE, org_id, attacker=attacker_id,
+                                           value=self.knowledge_counts[org_id, attacker_id])
+        self.share_versions[:] = self.pending_share_versions
+        self.attacks_list_mean[:] = self.knowledge_counts / 1000
+        self.update_detection_probabilities(model)
+
+
+class BatchedOrganizationActivation(SimultaneousActivation):
+    """
+    Simultaneous activation in which all organizations are stepped (and advanced) at once through the model's
+    OrganizationState, before the other agents of the phase. Organizations are not added to the schedule.
+    """
+
+    def step(self):
+        agent_keys = list(self._agents.keys())
+        self.model.org_state.step(self.model)
+        for agent_key in agent_keys:
+            self._agents[agent_key].step()
+        self.model.org_state.advance(self.model)
+        for agent_key in agent_keys:
+            self._agents[agent_key].advance()
+        self.steps += 1
+        self.time += 1
 
-        self.free_loading_ratio = 0  # variable to store freeloading ratio for each organization
 
-        # to store changing organization security
-        self.total_security = 0  # used for batch runner
-        self.avg_security = 0
+def _state_property(name):
+    """Property reading and writing an organization's entry of an OrganizationState array."""
+    def get(self):
+        return getattr(self.model.org_state, name)[self.id]
 
-        self.newly_compromised_per_step_aggregated = 0
-        self.avg_newly_compromised_per_step = 0  # TODO yet to be used
+    def set(self, value):
+        getattr(self.model.org_state, name)[self.id] = value
+    return property(get, set)
 
-        self.num_compromised = 0
-        self.avg_compromised_per_step = 0
 
-        self.incident_times = 0  # for avg incident time
-        self.avg_incident_times = 0  # for avg incident time
-        self.incident_times_num = 0  # for avg incident time
+class _StateRow:
+    """
+    An organization's row of an OrganizationState array. The view is bound on first access and cached in the
+    organization, so that it can be used as a plain attribute (updated in place only).
+    """
 
-        self.time_with_incident = 0
-        self.avg_time_with_incident = 0
+    def __init__(self, name):
+        self.name = name
 
-        # to store times organization shares when it enters a game
-        self.total_share = 0
-        self.avg_share = 0
-        self.num_games_played = 0
+    def __get__(self, org, owner=None):
+        if org is None:
+            return self
+        view = getattr(org.model.org_state, self.name)[org.id]
+        org.__dict__[self.name] = view
+        return view
 
-        # to store average known info
-        self.avg_info = 0
 
-        # to calculate avg number of unhandled incidents
-        self.unhandled_incidents_aggregate = 0
-        self.avg_unhandled_incidents = 0
-        self.num_incidents = 0
+# OrganizationState arrays of which every organization holds a row
+STATE_ROWS = ["old_attacks_list", "new_attacks_list", "attacks_list_predetermined", "attacks_list_predetermined_idx",
+              "attacks_list_mean", "pending_bits", "attacks_compromised_counts", "org_out", "attack_awareness",
+              "detection_counts"]
+
+
+class Organization(BetterAgent):
+    # scalar state, stored in the model's OrganizationState
+    security_budget = _state_property("security_budget")
+    security_change = _state_property("security_change")
+    security_drop = _state_property("security_drop")
+    num_detects_new = _state_property("num_detects_new")
+    num_compromised_new = _state_property("num_compromised_new")
+    num_compromised_old = _state_property("num_compromised_old")
+    utility = _state_property("utility")
+    info_in = _state_property("info_in")
+    info_out = _state_property("info_out")
+    free_loading_ratio = _state_property("free_loading_ratio")
+    total_security = _state_property("total_security")
+    avg_security = _state_property("avg_security")
+    newly_compromised_per_step_aggregated = _state_property("newly_compromised_per_step_aggregated")
+    avg_newly_compromised_per_step = _state_property("avg_newly_compromised_per_step")
+    num_compromised = _state_property("num_compromised")
+    avg_compromised_per_step = _state_property("avg_compromised_per_step")
+    time_with_incident = _state_property("time_with_incident")
+    avg_time_with_incident = _state_property("avg_time_with_incident")
+    total_share = _state_property("total_share")
+    avg_share = _state_property("avg_share")
+    num_games_played = _state_property("num_games_played")
+    avg_info = _state_property("avg_info")
+    avg_incident_times = _state_property("avg_incident_times")
+    avg_unhandled_incidents = _state_property("avg_unhandled_incidents")
+
+    # views over this organization's rows of the model-wide state, they must only be updated in place
+    old_attacks_list = _StateRow("old_attacks_list")
+    new_attacks_list = _StateRow("new_attacks_list")
+    attacks_list_predetermined = _StateRow("attacks_list_predetermined")  # for random seeding
+    attacks_list_predetermined_idx = _StateRow("attacks_list_predetermined_idx")
+    attacks_list_mean = _StateRow("attacks_list_mean")
+    pending_bits = _StateRow("pending_bits")  # bits learned since the last advance, see OrganizationState
+    attacks_compromised_counts = _StateRow("attacks_compromised_counts")
+    org_out = _StateRow("org_out")
+    attack_awareness = _StateRow("attack_awareness")
+    detection_counts = _StateRow("detection_counts")
+
+    def __init__(self, org_id, model, seed_sequence=None):
+        super().__init__(model)
+
+        self.id = org_id
+        # with common random numbers, the organization and each of its employees draw from their own stream
+        if seed_sequence is not None:
+            user_seeds = seed_sequence.spawn(self.model.device_count + 1)
+            self.rng = model.make_stream(user_seeds.pop(0))
+            user_rngs = [model.make_stream(s) for s in user_seeds]
+        else:
+            self.rng = model.rng
+            user_rngs = [None] * self.model.device_count
+        self.users = []
+        self.old_utility = 0
+        self.utility = 0
+
+        # for random seeding
+        for i in range(self.model.num_attackers):
+            self.attacks_list_predetermined[i] = np.arange(1000)
+            self.rng().shuffle(self.attacks_list_predetermined[i])
+
+        self.security_budget = max(0.005, min(1, self.rng().normal(0.5, 1 / 6)))
+        # self.security_budget = 0.005
+        self.risk_of_sharing = 0.3  # TODO: parametrize, possibly update in update_utility_sharing or whatever
+        self.security_drop = min(1, max(0, self.rng().normal(0.75, 0.05)))
+        self.acceptable_freeload = self.model.acceptable_freeload  # freeloading tolerance towards other organizations
+
+        # create employees (with the mean-field engine, they are replaced by an EmployeePopulation)
+        if not self.model.mean_field:
+            for i in range(0, self.model.device_count):
+                self.users.append(Employee(i, self, self.model, user_rngs[i]))
 
         # Extra data
         self.is_sharing_info = self.model.information_sharing
 
-        # <--- adding organization to model org array and setting unique ID --->
-
+    def __getstate__(self):
+        # a copy (or unpickled organization) binds its views to the copy of the model's state
+        state = self.__dict__.copy()
+        for name in STATE_ROWS:
+            state.pop(name, None)
+        return state
 
     def get_avg_compromised_per_step(self):
         return self.num_compromised / (self.model.schedule.time + 1)
@@ -105,12 +370,12 @@ class Organization(BetterAgent):
     def get_free_loading_ratio(self):
         return self.info_in / (self.info_in + self.info_out + 1e-5)
 
-    # returns whether or not to share information according to other party
-    def share_decision(self, org2, trust):
+    # returns whether or not to share information according to other party, drawing from the stream `rng`
+    def share_decision(self, org2, trust, rng):
         self.num_games_played += 1  # for data collector
         info_out = self.org_out[org2.id]  # org1 out (org1_info_out)
         info_in = org2.org_out[self.id]  # org1 in (org2_info_out)
-        r = globalVariables.RNG().random()
+        r = rng().random()
         if info_out > info_in:  # decreases probability to share
             share = r < trust * min(1, self.acceptable_freeload + (info_in / info_out))
         else:
@@ -119,48 +384,47 @@ class Organization(BetterAgent):
             self.total_share += 1  # for data collector
         return share
 
+    def learn_next_bit(self, attacker_id):
+        """Learns the next unknown bit of information about an attack, in the predetermined order."""
+        while self.attacks_list_predetermined_idx[attacker_id] < 1000:
+            next_bit = self.attacks_list_predetermined[attacker_id, self.attacks_list_predetermined_idx[attacker_id]]
+            if self.new_attacks_list[attacker_id, next_bit]:
+                self.attacks_list_predetermined_idx[attacker_id] += 1
+            else:
+                self.new_attacks_list[attacker_id, next_bit] = True
+                self.pending_bits.append(attacker_id * 1000 + next_bit)
+                self.attacks_list_predetermined_idx[attacker_id] += 1
+                break
+
+    def learn(self, bits):
+        """Sets the given bits (flat indices attack * 1000 + bit) in this organization's new knowledge."""
+        new = self.new_attacks_list.reshape(-1)
+        bits = bits[~new[bits]]
+        new[bits] = True
+        self.pending_bits.extend(bits.tolist())
+
+    def unknown_bits(self, org2):
+        """
+        Returns the bits of this organization's (old) knowledge that org2 doesn't know (in its old knowledge).
+        Only the bits learned since the last transmission to org2 are looked at.
+        """
+        state = self.model.org_state
+        bits = state.knowledge_log[self.id, state.share_versions[self.id, org2.id]:state.knowledge_version[self.id]]
+        return bits[~org2.old_attacks_list.reshape(-1)[bits]]
+
+    def transmit(self, org2):
+        """Shares this organization's (old) knowledge with org2, org2 learns it at the next advance."""
+        state = self.model.org_state
+        org2.learn(self.unknown_bits(org2))
+        state.pending_share_versions[self.id, org2.id] = state.knowledge_version[self.id]
+
     # returns average times an organization shared across all its played games
     def get_avg_share(self):
         return self.total_share / self.num_games_played
 
-    def update_budget(self):
-        total_detections = self.detection_counts.max()
-        if total_detections:  # a security incident happened and wasn't handled in time
-            self.security_change += (1 - self.security_budget) * (total_detections/self.model.device_count)
-        self.security_budget += self.security_change
-        self.security_budget = max(0.005, min(1.0, self.security_budget))
-        self.security_change = 0
-        self.detection_counts = np.zeros(self.model.num_attackers, dtype=np.int)
-
-    def update_incident_times(self, attack_id):
-        current_time = self.model.schedule.time
-        incident_time = current_time - self.attack_awareness[attack_id, 0] - self.model.org_memory
-        if incident_time > self.model.org_memory:
-            assert self.attack_awareness[attack_id, 3] == 1
-            self.unhandled_incidents.append(self.attack_awareness[attack_id, :].tolist())
-        self.model.incident_times.append(incident_time)
-        self.incident_times += incident_time  # for avg incident time
-
-    def set_avg_incident_time(self):  # for avg incident time
-        return self.incident_times / self.incident_times_num
-
     def set_avg_time_with_incident(self):
         return self.time_with_incident / (self.model.schedule.time + 1)
 
-    def start_incident(self, attack_id):
-        self.num_incidents += 1
-        self.attack_awareness[attack_id] = [self.model.schedule.time, self.model.schedule.time, 0, 1]
-
-    # remove attacker from awareness array if handled in acceptable time based on org memory
-    def clear_awareness(self, attack_id):
-        self.update_incident_times(attack_id)
-        self.incident_times_num += 1  # for avg incident time
-        self.avg_incident_times = self.set_avg_incident_time()
-        self.attack_awareness[attack_id] = [0, 0, 0, 0]
-
-        # <--- Updating average unhandled attacks per step --->
-        self.avg_unhandled_incidents = self.get_avg_unhandled_incidents()
-
     # return boolean if organization is aware of specific attack
     def is_aware(self, attack_id):
         return self.attack_awareness[attack_id]
@@ -168,8 +432,8 @@ class Organization(BetterAgent):
     def get_percent_compromised(self, attack_id=None):
         """Returns the percentage of users compromised for each attack (or the total if `attack` is None)"""
         if attack_id is not None:
-            return self.attacks_compromised_counts[attack_id] / len(self.users)
-        return self.num_compromised_old / len(self.users)
+            return self.attacks_compromised_counts[attack_id] / self.model.device_count
+        return self.num_compromised_old / self.model.device_count
 
     def set_avg_newly_compromised_per_step(self):
         return self.newly_compromised_per_step_aggregated / (self.model.schedule.time + 1)
@@ -177,62 +441,3 @@ class Organization(BetterAgent):
     # return amount of information known given a specific attack
     def get_info(self, attack_id):
         return self.attacks_list_mean[attack_id]
-
-    def get_avg_unhandled_incidents(self):
-        return self.unhandled_incidents_aggregate / self.num_incidents
-
-    def step(self):
-        self.count += 1
-        # organization updates its security budget every n steps based on previous step utility in order to improve its utility
-        if self.count == self.model.security_update_interval:
-            self.count = 0
-            self.update_budget()
-        # self.security_budget += self.security_change
-        # self.security_change = max(0, self.security_change - 0.005)
-        if self.num_detects_new == 0:
-            self.security_change -= (1-self.security_drop) * self.security_budget /self.model.security_update_interval
-        self.num_detects_new = 0
-
-        self.model.org_utility += self.utility  # adds organization utility to model's utility of all organizations
-        self.model.total_org_utility += self.utility  # adds organization utility to model's total utility of all organizations for the calculation of the average utility for the batchrunner
-
-        # for calculating the average NEWLY compromised per step
-        self.model.newly_compromised_per_step.append(self.num_compromised_new - self.num_compromised_old)
-        self.newly_compromised_per_step_aggregated += (self.num_compromised_new - self.num_compromised_old)  # Organization lvl
-        self.avg_newly_compromised_per_step = self.set_avg_newly_compromised_per_step()  # Organization lvl
-        self.num_compromised_old = self.num_compromised_new
-        # self.num_compromised_new = 0  # reset variable
-
-        self.free_loading_ratio = self.get_free_loading_ratio() # update freeloading ratio variable every step
-
-        # <-- updating security variables to get security averages --->
-        self.total_security += self.security_budget
-        self.avg_security = self.get_avg_security()
-
-        # <--- updating average number of times shared when playing a game --->
-        if self.num_games_played > 0:
-            self.avg_share = self.get_avg_share()
-
-        # <--- updating average information known about all attacks --->
-        if len(self.old_attacks_list) > 0:
-            self.avg_info = self.get_avg_known_info()
-
-        if len(self.attack_awareness) > 0:
-            self.time_with_incident += 1
-
-        self.avg_time_with_incident = self.set_avg_time_with_incident()
-
-        # self.avg_compromised = self.get_avg_compromised()
-
-        # <--- Updating average compromised per step --->
-        self.avg_compromised_per_step = self.get_avg_compromised_per_step()
-
-
-    def advance(self):
-        self.old_attacks_list = self.new_attacks_list.copy()
-        self.attacks_list_mean = self.old_attacks_list.mean(axis=1)
-        # current_time = self.model.schedule.time
-
-        # for attack_id in range(self.attack_awareness.shape[0]):
-        #     if self.is_aware(attack_id) and current_time - self.attack_awareness[attack_id, 1] > self.model.org_memory:
-        #         self.clear_awareness(attack_id)
@@ -0,0 +1,199 @@
+"""
+Off-thread collection of the model reporters.
+
+With `CybCim(async_collection=True)`, collecting the data of a step only publishes a ModelSnapshot: read-only
+copies of the few arrays the model reporters read. The reporters run on a background thread (or process) while
+the simulation moves on to the next step. At most `max_pending` snapshots wait to be reported: when the
+reporters fall behind, publishing blocks until one is processed (back-pressure), so memory stays bounded.
+
+Reading `model_vars` (or the dataframe) waits for the pending snapshots first, so the collector reads like a
+synchronous DataCollector. Only model reporters reading ModelSnapshot attributes are supported.
+
+The worker is stopped by `close` (CybCim.close), or when the collector is garbage collected.
+"""
+import multiprocessing
+import queue
+import threading
+import traceback
+import weakref
+from mesa.datacollection import DataCollector
+
+
+class ScheduleSnapshot:
+    def __init__(self, steps, time):
+        self.steps = steps
+        self.time = time
+
+
+class OrganizationSnapshot:
+    def __init__(self, snapshot, org_id):
+        self.id = org_id
+        self.info_in = snapshot.info_in[org_id]
+        self.info_out = snapshot.info_out[org_id]
+        self.security_budget = snapshot.security_budget[org_id]
+        self.avg_security = snapshot.avg_security[org_id]
+
+
+class ModelSnapshot:
+    """Immutable copy of the model state read by the model reporters, taken after a step."""
+
+    def __init__(self, model):
+        state = model.org_state
+        self.schedule = ScheduleSnapshot(model.schedule.steps, model.schedule.time)
+        self.num_firms = model.num_firms
+        self.num_attackers = model.num_attackers
+        self.active_attacker_count = model.active_attacker_count
+        self.total_compromised = model.total_compromised
+        self.closeness_matrix = _frozen(model.closeness_matrix)
+        self.trust_matrix = _frozen(model.trust_matrix)
+        self.info_in = _frozen(state.info_in)
+        self.info_out = _frozen(state.info_out)
+        self.security_budget = _frozen(state.security_budget)
+        self.avg_security = _frozen(state.avg_security)
+
+    @property
+    def organizations(self):
+        return [OrganizationSnapshot(self, i) for i in range(self.num_firms)]
+
+
+def _frozen(array):
+    array = array.copy()
+    array.flags.writeable = False
+    return array
+
+
+def _report(reporters, snapshot):
+    return [reporter(snapshot) for reporter in reporters]
+
+
+def _collect_thread(reporters, snapshots, model_vars, errors):
+    """Main loop of a collector thread: appends the reports of every snapshot received until None."""
+    while True:
+        snapshot = snapshots.get()
+        try:
+            if snapshot is None:
+                break
+            if not errors:
+                for values, value in zip(model_vars.values(), _report(reporters, snapshot)):
+                    values.append(value)
+        except Exception:
+            errors.append(traceback.format_exc())
+        finally:
+            snapshots.task_done()
+
+
+def _stop_worker(snapshots, worker, results=None):
+    snapshots.put(None)
+    if worker is not threading.current_thread():
+        worker.join(5)
+        # a process exits once its unread results are consumed, which they won't be once the collector is gone
+        if worker.is_alive() and hasattr(worker, "terminate"):
+            worker.terminate()
+    if results is not None:  # stop the feeder threads of the process queues
+        for q in (snapshots, results):
+            q.cancel_join_thread()
+            q.close()
+
+
+def _collect_process(reporters, snapshots, results):
+    """Main loop of a collector process: reports every snapshot received until None."""
+    while True:
+        snapshot = snapshots.get()
+        if snapshot is None:
+            break
+        try:
+            results.put(("ok", _report(reporters, snapshot)))
+        except Exception:
+            results.put(("error", traceback.format_exc()))
+
+
+class AsyncDataCollector(DataCollector):
+    """
+    DataCollector running its model reporters off the simulation thread.
+    :param max_pending: maximum number of snapshots waiting to be reported
+    :param use_process: run the reporters in a separate process instead of a thread (reporters must be
+                        picklable, i.e. module level functions)
+    """
+
+    def __init__(self, model_reporters, max_pending=16, use_process=False):
+        self.max_pending = max_pending
+        self.use_process = use_process
+        self._worker = None
+        super().__init__(model_reporters)
+
+    # the reported values, complete once the pending snapshots are processed
+    @property
+    def model_vars(self):
+        self.flush()
+        return self._model_vars
+
+    @model_vars.setter
+    def model_vars(self, value):
+        self._model_vars = value
+
+    def _start(self):
+        self._submitted = 0
+        self._received = 0
+        self._errors = []
+        reporters = list(self.model_reporters.values())
+        if self.use_process:
+            context = multiprocessing.get_context()
+            self._snapshots = context.Queue(self.max_pending)
+            self._results = context.Queue()
+            self._worker = context.Process(target=_collect_process, args=(reporters, self._snapshots, self._results),
+                                           daemon=True)
+        else:
+            # the thread doesn't reference the collector, which can then be garbage collected
+            self._snapshots = queue.Queue(self.max_pending)
+            self._worker = threading.Thread(target=_collect_thread,
+                                            args=(reporters, self._snapshots, self._model_vars, self._errors),
+                                            daemon=True)
+        self._worker.start()
+        self._stop = weakref.finalize(self, _stop_worker, self._snapshots, self._worker,
+                                      self._results if self.use_process else None)
+
+    def _append(self, values):
+        for name, value in zip(self.model_reporters, values):
+            self._model_vars[name].append(value)
+
+    def collect(self, model):
+        """Publishes a snapshot of the model, reported in the background."""
+        if self._worker is None:
+            self._start()
+        self._snapshots.put(ModelSnapshot(model))  # blocks while max_pending snapshots are waiting
+        self._submitted += 1
+
+    def flush(self):
+        """Waits until every published snapshot is reported."""
+        if self._worker is None:
+            return
+        if self.use_process:
+            while self._received < self._submitted:
+                status, values = self._results.get()
+                self._received += 1
+                if status == "error":
+                    self._errors.append(values)
+                elif not self._errors:
+                    self._append(values)
+        else:
+            self._snapshots.join()
+        if self._errors:
+            raise RuntimeError("A model reporter failed:\n%s" % self._errors[0])
+
+    def close(self):
+        """Reports the pending snapshots and stops the worker."""
+        if self._worker is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._stop()
+            self._worker = None
+
+    def __getstate__(self):
+        # copies and pickles hold the reported values, their worker is started again when collecting
+        self.flush()
+        state = {k: v for k, v in self.__dict__.items()
+                 if k not in ("_snapshots", "_results", "_worker", "_stop")}
+        state["_worker"] = None
+        return state
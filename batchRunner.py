@@ -1,19 +1,166 @@
 from model import *
 from agents import subnetworks
 from mesa.batchrunner import BatchRunner, BatchRunnerMP
+from tqdm import tqdm
+import pandas as pd
 import numpy as np
+import copy
 import globalVariables
+from resultCache import ResultCache, model_parameters, relevant_parameters
+from statsHelpers import OnlineStats
+from pairedRun import make_pair, run_pair
+from itertools import product, count
+
+# model of this worker process's last run, reset for the next run instead of building a new model
+_worker_models = {}
 
 
 class BatchRunnerNew(BatchRunnerMP):
     def __init__(self, model_cls, variable_parameters=None,
                  fixed_parameters=None, iterations=1, max_steps=1000,
                  model_reporters=None, agent_reporters=None,
-                 display_progress=True):
+                 display_progress=True, trajectory_store=None, result_cache=None, reuse_models=True,
+                 deduplicate=True):
         super().__init__(model_cls, nr_processes=6, variable_parameters=variable_parameters,
                          fixed_parameters=fixed_parameters, iterations=iterations, max_steps=max_steps,
                          model_reporters=model_reporters, agent_reporters=agent_reporters,
                          display_progress=display_progress)
+        # optional TrajectoryStore receiving the per-step organization trajectories of every run
+        self.trajectory_store = trajectory_store
+        # optional ResultCache, runs already in it are not simulated again
+        self.result_cache = result_cache
+        # whether the workers reset the model of their previous run (see CybCim.reset) instead of building one
+        self.reuse_models = reuse_models
+        # whether configurations only differing by parameters irrelevant to them (see CybCim.PARAMETER_DEPENDENCIES)
+        # are simulated once, their results being copied to every equivalent configuration
+        self.deduplicate = deduplicate
+        self.simulations = {}  # simulation key -> (model_vars, agent_vars), see run_simulations
+
+    def run_all(self):
+        """ Run the model at all parameter combinations, each distinct simulation only once. """
+        total_iterations, all_kwargs, all_param_values = self._make_model_args()
+        run_count = count()
+        jobs = []
+        model_keys = []
+        for kwargs, param_values in zip(all_kwargs, all_param_values):
+            for _ in range(self.iterations):
+                jobs.append((kwargs, next(run_count)))
+                model_keys.append((param_values or ()) + (jobs[-1][1],))
+
+        with tqdm(total=total_iterations, disable=not self.display_progress) as pbar:
+            results = self.run_simulations(jobs, pbar)
+        for model_key, (model_vars, agent_vars) in zip(model_keys, results):
+            if self.model_reporters:
+                self.model_vars[model_key] = model_vars
+            if self.agent_reporters:
+                for agent_id, reports in agent_vars.items():
+                    self.agent_vars[model_key + (agent_id,)] = reports
+
+    def simulation_key(self, kwargs):
+        """
+        Returns a key shared by the runs that give identical results: seeded runs with the same relevant
+        parameters. None if the run's results can't be shared (unseeded run, deduplication off, or trajectories
+        recorded per run).
+        """
+        if not self.deduplicate or self.trajectory_store is not None:
+            return None
+        params = model_parameters(self.model_cls, kwargs)
+        if not params.get("global_seed", False):
+            return None
+        return repr(sorted(relevant_parameters(self.model_cls, params).items()))
+
+    def run_simulations(self, jobs, pbar=None):
+        """
+        Runs the jobs (kwargs, run_count) in the pool, and returns their (model_vars, agent_vars). Every distinct
+        simulation is run once: equivalent jobs (see simulation_key), including the jobs equivalent to a simulation
+        run earlier by this runner, get its results.
+        """
+        keys = [self.simulation_key(kwargs) for kwargs, _ in jobs]
+        runs = {}  # simulation to run -> index of the job running it
+        for i, key in enumerate(keys):
+            if key is None:
+                runs[("run", i)] = i
+            elif key not in self.simulations and key not in runs:
+                runs[key] = i
+        results = {}
+        for i, result in zip(runs.values(), self.pool.imap(self._run_simulation, [jobs[i] for i in runs.values()])):
+            results[i] = result
+            if pbar is not None:
+                pbar.update()
+        for key, i in runs.items():
+            if keys[i] is not None:
+                self.simulations[key] = results[i]
+        if pbar is not None:
+            pbar.update(len(jobs) - len(runs))  # the jobs served by another simulation
+        return [results[i] if key is None else self.simulations[key] for i, key in enumerate(keys)]
+
+    def _run_simulation(self, job):
+        kwargs, run_count = job
+        return self.run_or_fetch(kwargs, run_count)
+
+    def run_iteration(self, kwargs, param_values, run_count):
+        model_vars, agent_vars = self.run_or_fetch(kwargs, run_count)
+
+        # Collect and store results:
+        if param_values is not None:
+            model_key = param_values + (run_count,)
+        else:
+            model_key = (run_count,)
+
+        if self.model_reporters:
+            self.model_vars[model_key] = model_vars
+        if self.agent_reporters:
+            for agent_id, reports in agent_vars.items():
+                agent_key = model_key + (agent_id,)
+                self.agent_vars[agent_key] = reports
+
+        return (getattr(self, "model_vars", None), getattr(self, "agent_vars", None))
+
+    def run_or_fetch(self, kwargs, run_count):
+        """ Returns the model and agent reporter values of a run, from the result cache if possible. """
+        cache_key, cached = self.fetch(kwargs)
+        # a run with a trajectory store attached has to be simulated to record its trajectories
+        if cached is not None and self.trajectory_store is None:
+            return cached
+
+        kwargscopy = copy.deepcopy(kwargs)
+        model = self.make_model(kwargscopy)
+        if self.trajectory_store is not None:
+            model.trajectory_recorder = self.trajectory_store.recorder(run_count)
+        self.run_model(model)
+        return self.finish_run(model, cache_key)
+
+    def make_model(self, kwargs):
+        """ Returns a model for a run with `kwargs`, the worker's previous model reset if models are reused. """
+        if not self.reuse_models or not hasattr(self.model_cls, "reset"):
+            return self.model_cls(**kwargs)
+        model = _worker_models.get(self.model_cls)
+        if model is None:
+            model = _worker_models[self.model_cls] = self.model_cls(**kwargs)
+        else:
+            model.reset(**model_parameters(self.model_cls, kwargs))
+        return model
+
+    def fetch(self, kwargs):
+        """ Returns (cache key, cached reporter values) of a run, either being None when not available. """
+        if self.result_cache is None:
+            return None, None
+        cache_key = self.result_cache.key(self.model_cls, kwargs, self.max_steps)
+        if cache_key is None:
+            return None, None
+        return cache_key, self.result_cache.get(cache_key, self.model_reporters, self.agent_reporters)
+
+    def finish_run(self, model, cache_key=None):
+        """ Closes the trajectory recorder of a completed run, collects its reporters and caches them. """
+        if model.trajectory_recorder is not None:
+            model.trajectory_recorder.close()
+        model_vars = self.collect_model_vars(model) if self.model_reporters else {}
+        agent_vars = self.collect_agent_vars(model) if self.agent_reporters else {}
+        if hasattr(model, "close"):
+            model.close()
+        if cache_key is not None:
+            self.result_cache.put(cache_key, model_vars, agent_vars, self.model_reporters, self.agent_reporters)
+        return model_vars, agent_vars
 
     def collect_agent_vars(self, model):
         """ Run reporters and collect agent-level variables. """
@@ -26,6 +173,352 @@ class BatchRunnerNew(BatchRunnerMP):
         return agent_vars
 
 
+class AdaptiveBatchRunner(BatchRunnerNew):
+    """
+    Batch runner that decides the number of replicates of every configuration on the fly.
+
+    `variable_parameters` must contain `seed_parameter`, whose values are the candidate seeds (replicates).
+    Replicates are scheduled in waves. After every wave the confidence interval of the mean of every tracked
+    reporter is updated for each configuration; a configuration stops receiving replicates once all of its
+    intervals are within the target precision (or its seeds run out). Slots of a wave not needed by the
+    configurations still below `min_replicates` go to the noisiest remaining configurations. A wave has at most
+    `wave_size` runs, configurations below `min_replicates` wait for the next waves when there are more.
+
+    Model reporters returning lists and agent reporters are averaged into one value per run
+    (e.g. average security per firm becomes the average over all firms).
+    """
+
+    def __init__(self, model_cls, variable_parameters=None, fixed_parameters=None, max_steps=1000,
+                 model_reporters=None, agent_reporters=None, display_progress=True,
+                 seed_parameter="global_seed_value", target_precision=0.05, relative_precision=True,
+                 confidence=0.95, min_replicates=5, wave_size=6, tracked_reporters=None, **kwargs):
+        super().__init__(model_cls, variable_parameters=variable_parameters, fixed_parameters=fixed_parameters,
+                         iterations=1, max_steps=max_steps, model_reporters=model_reporters,
+                         agent_reporters=agent_reporters, display_progress=display_progress, **kwargs)
+        if seed_parameter not in self.variable_parameters:
+            raise ValueError("variable_parameters must contain the seed parameter %s" % seed_parameter)
+        if min_replicates < 2:
+            raise ValueError("min_replicates must be at least 2 to get a confidence interval")
+        self.seed_parameter = seed_parameter
+        self.seeds = list(self.variable_parameters[seed_parameter])
+        self.target_precision = target_precision
+        self.relative_precision = relative_precision
+        self.confidence = confidence
+        self.min_replicates = min_replicates
+        if wave_size < 1:
+            raise ValueError("wave_size must be at least 1")
+        self.wave_size = wave_size
+        if tracked_reporters is None:
+            tracked_reporters = list((model_reporters or {}).keys()) + list((agent_reporters or {}).keys())
+        self.tracked_reporters = tracked_reporters
+        self.statistics = {}
+
+    def _make_configurations(self):
+        """Returns the list of (kwargs, param_values) of every configuration, seed excluded."""
+        names = [name for name in self.variable_parameters.keys() if name != self.seed_parameter]
+        configurations = []
+        for values in product(*[self.variable_parameters[name] for name in names]):
+            kwargs = dict(zip(names, values))
+            kwargs.update(self.fixed_parameters)
+            configurations.append((kwargs, values))
+        return configurations
+
+    def _precision_ratio(self, config):
+        """Largest ratio of interval half width to target precision among the tracked reporters (<= 1: done)."""
+        ratio = 0
+        for reporter in self.tracked_reporters:
+            stats = self.statistics[config][reporter]
+            target = self.target_precision
+            if self.relative_precision:
+                target *= abs(stats.mean)
+            half_width = stats.half_width(self.confidence)
+            if half_width == 0:
+                continue
+            ratio = max(ratio, half_width / target if target > 0 else float("inf"))
+        return ratio
+
+    def _schedule_wave(self, configurations, scheduled):
+        active = [c for c in range(len(configurations)) if scheduled[c] < len(self.seeds) and
+                  (scheduled[c] < self.min_replicates or self._precision_ratio(c) > 1)]
+        # configurations below min_replicates first, a wave has at most wave_size runs
+        wave = []
+        for c in active:
+            wave += [c] * max(0, min(self.min_replicates, len(self.seeds)) - scheduled[c])
+
+        # hand the spare slots of the wave to the noisiest configurations
+        noisy = sorted((c for c in active if scheduled[c] >= self.min_replicates),
+                       key=self._precision_ratio, reverse=True)
+        while noisy and len(wave) < self.wave_size:
+            for c in list(noisy):
+                if len(wave) >= self.wave_size:
+                    break
+                if scheduled[c] + wave.count(c) >= len(self.seeds):
+                    noisy.remove(c)
+                    continue
+                wave.append(c)
+        return wave[:self.wave_size]
+
+    def _run_value(self, reporter, model_vars, agent_vars):
+        if reporter in model_vars:
+            return float(np.mean(model_vars[reporter]))
+        return float(np.mean([record[reporter] for record in agent_vars.values()]))
+
+    def run_all(self):
+        """ Run replicates in waves until every configuration reaches the target precision. """
+        configurations = self._make_configurations()
+        seed_position = list(self.variable_parameters.keys()).index(self.seed_parameter)
+        self.statistics = {c: {r: OnlineStats() for r in self.tracked_reporters} for c in range(len(configurations))}
+        scheduled = [0] * len(configurations)
+        run_count = 0
+
+        with tqdm(total=len(configurations) * len(self.seeds), disable=not self.display_progress) as pbar:
+            while True:
+                wave = self._schedule_wave(configurations, scheduled)
+                if not wave:
+                    break
+                jobs = []
+                for c in wave:
+                    kwargs, values = configurations[c]
+                    seed = self.seeds[scheduled[c]]
+                    scheduled[c] += 1
+                    job_kwargs = dict(kwargs)
+                    job_kwargs[self.seed_parameter] = seed
+                    param_values = values[:seed_position] + (seed,) + values[seed_position:]
+                    jobs.append((job_kwargs, param_values, run_count))
+                    run_count += 1
+
+                results = self.run_simulations([(kwargs, job_run) for kwargs, _, job_run in jobs])
+                for c, (_, param_values, job_run), (model_vars, agent_vars) in zip(wave, jobs, results):
+                    model_key = param_values + (job_run,)
+                    if self.model_reporters:
+                        self.model_vars[model_key] = model_vars
+                    if self.agent_reporters:
+                        for agent_id, reports in agent_vars.items():
+                            self.agent_vars[model_key + (agent_id,)] = reports
+                    for reporter in self.tracked_reporters:
+                        self.statistics[c][reporter].add(self._run_value(reporter, model_vars, agent_vars))
+                pbar.update(len(jobs))
+
+    def get_precision_dataframe(self):
+        """ Generate a pandas DataFrame with the replicate count and confidence interval of every configuration. """
+        names = [name for name in self.variable_parameters.keys() if name != self.seed_parameter]
+        records = []
+        for c, (kwargs, values) in enumerate(self._make_configurations()):
+            for reporter in self.tracked_reporters:
+                stats = self.statistics[c][reporter]
+                record = dict(zip(names, values))
+                record.update({"Reporter": reporter, "Replicates": stats.n, "Mean": stats.mean,
+                               "Half width": stats.half_width(self.confidence)})
+                records.append(record)
+        return pd.DataFrame(records)
+
+
+class SuccessiveHalvingSearch(BatchRunnerNew):
+    """
+    Multi-fidelity search of the configurations of `variable_parameters` (seed excluded) with the best objective,
+    by successive halving.
+
+    Every configuration is first evaluated on a short horizon (`min_steps`) with few seeds (`min_seeds`). Only
+    the best 1/`eta` configurations are promoted to the next rung, evaluated `eta` times longer with `eta` times
+    more seeds, until the full horizon (`max_steps`) and all the seeds are reached or a single configuration
+    remains. A configuration's score is the mean objective over its seeds.
+
+    All runs are built with max_num_steps = `max_steps`, so a short run is the beginning of the full run (the
+    attackers' arrival steps depend on it).
+    :param objective: function of a model, or label of one of `model_reporters`, evaluated at the end of a run
+    :param maximize: whether higher objective values are better
+    """
+
+    def __init__(self, model_cls, variable_parameters=None, fixed_parameters=None, max_steps=1000,
+                 model_reporters=None, objective=None, maximize=True, seed_parameter="global_seed_value",
+                 min_steps=50, min_seeds=1, eta=3, display_progress=True, **kwargs):
+        fixed_parameters = dict(fixed_parameters or {})
+        fixed_parameters.setdefault("max_num_steps", max_steps)
+        super().__init__(model_cls, variable_parameters=variable_parameters, fixed_parameters=fixed_parameters,
+                         iterations=1, max_steps=max_steps, model_reporters=model_reporters,
+                         display_progress=display_progress, **kwargs)
+        if seed_parameter not in self.variable_parameters:
+            raise ValueError("variable_parameters must contain the seed parameter %s" % seed_parameter)
+        if isinstance(objective, str):
+            objective = self.model_reporters[objective]
+        if objective is None:
+            raise ValueError("an objective is required")
+        if eta < 2:
+            raise ValueError("eta must be at least 2")
+        self.objective = objective
+        self.maximize = maximize
+        self.seed_parameter = seed_parameter
+        self.seeds = list(self.variable_parameters[seed_parameter])
+        self.min_steps = min_steps
+        self.min_seeds = min_seeds
+        self.eta = eta
+        self.evaluations = {}  # (simulation key, steps) -> objective, see _evaluate_all
+        self.rungs = []  # records of every evaluated configuration, see get_rungs_dataframe
+        self.best = None  # kwargs of the best configuration
+        self.steps_simulated = 0
+
+    def _make_configurations(self):
+        """Returns the list of (kwargs, param_values) of every configuration, seed excluded."""
+        names = [name for name in self.variable_parameters.keys() if name != self.seed_parameter]
+        return [(dict(zip(names, values), **self.fixed_parameters), values)
+                for values in product(*[self.variable_parameters[name] for name in names])]
+
+    def _evaluate(self, job):
+        """ Returns the objective at the end of a run of `steps` steps, from the result cache if possible. """
+        kwargs, steps = job
+        reporters = {"objective": self.objective}
+        cache_key = self.result_cache.key(self.model_cls, kwargs, steps) if self.result_cache is not None else None
+        if cache_key is not None:
+            cached = self.result_cache.get(cache_key, reporters)
+            if cached is not None:
+                return cached[0]["objective"], 0
+        model = self.make_model(copy.deepcopy(kwargs))
+        while model.running and model.schedule.steps < steps:
+            model.step()
+        value = self.objective(model)
+        if hasattr(model, "close"):
+            model.close()
+        if cache_key is not None:
+            self.result_cache.put(cache_key, {"objective": value}, {}, reporters)
+        return value, model.schedule.steps
+
+    def _evaluate_all(self, jobs):
+        """ Returns the objective of every job (kwargs, steps), running equivalent jobs once. """
+        keys = []
+        for i, (kwargs, steps) in enumerate(jobs):
+            key = self.simulation_key(kwargs)
+            keys.append((key, steps) if key is not None else ("run", i))
+        runs = {}
+        for key, job in zip(keys, jobs):
+            if key not in self.evaluations:
+                runs.setdefault(key, job)
+        for key, (value, steps) in zip(runs, self.pool.map(self._evaluate, list(runs.values()))):
+            self.evaluations[key] = value
+            self.steps_simulated += steps
+        return [self.evaluations[key] for key in keys]
+
+    def run_all(self):
+        """ Run the rungs of successive halving. The best configuration's kwargs end up in `best`. """
+        configurations = self._make_configurations()
+        survivors = list(range(len(configurations)))
+        rung = 0
+        with tqdm(disable=not self.display_progress) as pbar:
+            while True:
+                steps = min(self.max_steps, self.min_steps * self.eta ** rung)
+                seeds = self.seeds[:min(len(self.seeds), self.min_seeds * self.eta ** rung)]
+                jobs = [(dict(configurations[c][0], **{self.seed_parameter: seed}), steps)
+                        for c in survivors for seed in seeds]
+                values = iter(self._evaluate_all(jobs))
+                scores = {}
+                for c in survivors:
+                    scores[c] = float(np.mean([next(values) for _ in seeds]))
+                    self.rungs.append((rung, configurations[c][1], steps, len(seeds), scores[c]))
+                pbar.update(len(jobs))
+
+                survivors.sort(key=lambda c: scores[c], reverse=self.maximize)
+                if len(survivors) == 1 or (steps == self.max_steps and len(seeds) == len(self.seeds)):
+                    break
+                survivors = survivors[:max(1, len(survivors) // self.eta)]
+                rung += 1
+        self.best = configurations[survivors[0]][0]
+
+    def get_rungs_dataframe(self):
+        """ Generate a pandas DataFrame with the score of every configuration evaluated at every rung. """
+        names = [name for name in self.variable_parameters.keys() if name != self.seed_parameter]
+        records = []
+        for rung, values, steps, seeds, score in self.rungs:
+            record = dict(zip(names, values))
+            record.update({"Rung": rung, "Steps": steps, "Seeds": seeds, "Score": score})
+            records.append(record)
+        return pd.DataFrame(records)
+
+
+class PairedBatchRunner(BatchRunnerNew):
+    """
+    Batch runner for sharing vs. no sharing comparisons. Every configuration is run as a pair (see pairedRun.py):
+    both variants are built from the same seed and run in lockstep in the same worker.
+
+    `information_sharing` is added to the variable parameters if missing (its values are ignored, both variants
+    are always run), so the model and agent dataframes have the same layout as a regular sweep over it.
+    When `difference_fields` (names of STEP_FIELDS) is given, the per-step differences with sharing minus without
+    sharing are recorded and available with get_differences_dataframe.
+    """
+
+    def __init__(self, model_cls, variable_parameters=None, fixed_parameters=None, iterations=1, max_steps=1000,
+                 model_reporters=None, agent_reporters=None, display_progress=True, difference_fields=None,
+                 **kwargs):
+        variable_parameters = dict(variable_parameters or {})
+        variable_parameters["information_sharing"] = [True, False]
+        super().__init__(model_cls, variable_parameters=variable_parameters, fixed_parameters=fixed_parameters,
+                         iterations=iterations, max_steps=max_steps, model_reporters=model_reporters,
+                         agent_reporters=agent_reporters, display_progress=display_progress, **kwargs)
+        self.difference_fields = difference_fields
+        self.differences = {}
+
+    def _make_pairs(self):
+        """Returns the list of (kwargs, param_values, run_count) of every pair, information_sharing excluded."""
+        names = [name for name in self.variable_parameters.keys() if name != "information_sharing"]
+        jobs = []
+        run_count = 0
+        for values in product(*[self.variable_parameters[name] for name in names]):
+            kwargs = dict(zip(names, values))
+            kwargs.update(self.fixed_parameters)
+            for _ in range(self.iterations):
+                jobs.append((kwargs, values, run_count))
+                run_count += 2  # one run id per variant
+        return jobs
+
+    def _run_pair_job(self, job):
+        kwargs, values, run_count = job
+        position = list(self.variable_parameters.keys()).index("information_sharing")
+        keys = [values[:position] + (sharing,) + values[position:] + (run_count + i,)
+                for i, sharing in enumerate((True, False))]
+        cache_keys, cached = zip(*[self.fetch(dict(kwargs, information_sharing=sharing)) for sharing in (True, False)])
+        # pairs are only simulated when a variant or the differences are missing
+        if None not in cached and self.trajectory_store is None and self.difference_fields is None:
+            return list(zip(keys, cached)), None
+
+        sharing, no_sharing = make_pair(self.model_cls, **copy.deepcopy(kwargs))
+        if self.trajectory_store is not None:
+            sharing.trajectory_recorder = self.trajectory_store.recorder(run_count)
+            no_sharing.trajectory_recorder = self.trajectory_store.recorder(run_count + 1)
+        differences = run_pair(sharing, no_sharing, self.max_steps, self.difference_fields or [])
+        results = [(keys[0], self.finish_run(sharing, cache_keys[0])),
+                   (keys[1], self.finish_run(no_sharing, cache_keys[1]))]
+        return results, differences if self.difference_fields is not None else None
+
+    def run_all(self):
+        """ Run every pair and store the results of both variants. """
+        jobs = self._make_pairs()
+        with tqdm(total=len(jobs) * 2, disable=not self.display_progress) as pbar:
+            for (kwargs, values, run_count), (results, differences) in zip(jobs, self.pool.map(self._run_pair_job,
+                                                                                                jobs)):
+                for model_key, (model_vars, agent_vars) in results:
+                    if self.model_reporters:
+                        self.model_vars[model_key] = model_vars
+                    if self.agent_reporters:
+                        for agent_id, reports in agent_vars.items():
+                            self.agent_vars[model_key + (agent_id,)] = reports
+                if differences is not None:
+                    self.differences[values + (run_count,)] = differences
+                pbar.update(2)
+
+    def get_differences_dataframe(self):
+        """ Generate a pandas DataFrame with the per-step differences (sharing minus no sharing) of every pair. """
+        names = [name for name in self.variable_parameters.keys() if name != "information_sharing"]
+        fields = ["step"] + [f for f in self.difference_fields or [] if f != "step"]
+        frames = []
+        for key, differences in self.differences.items():
+            frame = pd.DataFrame(differences, columns=fields)
+            for name, value in zip(names + ["Run"], key):
+                frame[name] = value
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=names + ["Run"] + fields)
+        df = pd.concat(frames, ignore_index=True)
+        return df[names + ["Run"] + fields]
+
+
 def main():
     fixed_params = {
         # "reciprocity": 1,
@@ -41,41 +534,45 @@ def main():
              90884, 22236, 11460, 7905, 18348, 51153, 22630, 79033, 88405, 62153, 84849, 23375, 26388, 33618]
     variable_params = {
         "global_seed_value": seeds_1,
-        "information_sharing": {True, False},
+        "information_sharing": {True, False},  # every seed is run as a sharing / no sharing pair
         # "information_sharing": {False},
     }
 
-    batch_run = BatchRunnerNew(CybCim,
-                               variable_params,
-                               fixed_params,
-                               iterations=1,
-                               max_steps=1000,
-                               model_reporters={
-                                   "Number of Attackers":  get_num_attackers
-                                   # "Average Utility loss": get_avg_utility_batch,
-                                   # "Closeness": get_avg_closeness,
-                                   # "Average freeloading": get_avg_free_loading,
-                                   # "Average Incident time": get_avg_incident_time,
-                                   # "Average of newly compromised per step": get_avg_newly_compromised_per_step
-
-                               },
-                               agent_reporters={
-                                   # "Average incident time per Firm": "avg_incident_times",
-                                   # "Free loading per Firm": "free_loading_ratio",
-                                   "Average security per Firm": "avg_security",
-                                   # "Avg. num. of NEWLY compromised per step": "avg_newly_compromised_per_step",
-                                   "Avg. of compromised per step": "avg_compromised_per_step",
-                                   # "percentage of unhandled incidents per Firm": "avg_unhandled_incidents",
-                                   # "Info sharing?": "is_sharing_info"
-                                   # "Avg. info shared per Firm": "avg_info"
-                               },
-                               display_progress=True)
+    batch_run = PairedBatchRunner(CybCim,
+                                  variable_params,
+                                  fixed_params,
+                                  iterations=1,
+                                  max_steps=1000,
+                                  model_reporters={
+                                      "Number of Attackers":  get_num_attackers
+                                      # "Average Utility loss": get_avg_utility_batch,
+                                      # "Closeness": get_avg_closeness,
+                                      # "Average freeloading": get_avg_free_loading,
+                                      # "Average Incident time": get_avg_incident_time,
+                                      # "Average of newly compromised per step": get_avg_newly_compromised_per_step
+
+                                  },
+                                  agent_reporters={
+                                      # "Average incident time per Firm": "avg_incident_times",
+                                      # "Free loading per Firm": "free_loading_ratio",
+                                      "Average security per Firm": "avg_security",
+                                      # "Avg. num. of NEWLY compromised per step": "avg_newly_compromised_per_step",
+                                      "Avg. of compromised per step": "avg_compromised_per_step",
+                                      # "percentage of unhandled incidents per Firm": "avg_unhandled_incidents",
+                                      # "Info sharing?": "is_sharing_info"
+                                      # "Avg. info shared per Firm": "avg_info"
+                                  },
+                                  display_progress=True,
+                                  result_cache=ResultCache("result_cache", max_bytes=2 * 1024 ** 3),
+                                  difference_fields=["compromised", "security"])
     batch_run.run_all()
 
     run_data_model = batch_run.get_model_vars_dataframe()
     run_data_model.to_csv("D:\Materials\cybsim\Model-Result-1-share-no-share-sec-comp.csv")
     run_data_agents = batch_run.get_agent_vars_dataframe()
     run_data_agents.to_csv("D:\Materials\cybsim\Agent-Result-1-share-no-share-sec-comp.csv")
+    run_data_differences = batch_run.get_differences_dataframe()
+    run_data_differences.to_csv("D:\Materials\cybsim\Paired-Differences-1-share-no-share-sec-comp.csv")
     # run_data.to_csv("Result_1.csv")
     # run_data.to_csv("Result_2.csv")
 
@@ -0,0 +1,311 @@
+"""
+Compact event log of a CybCim run, and replay of the visualization from it.
+
+Attach a recorder to a model with `model.event_log = EventLog(model)`, run it and `save` the log. The log holds a
+snapshot of the model when the recorder was attached and one fixed-size binary record per event: infections,
+cleans, detections, information shared, trust and closeness updates, attacker arrivals, security budget updates
+and knowledge gained. ReplayModel rebuilds the state shown by the visualization at any step from the log, so a
+run can be played back and scrubbed without simulating it again.
+
+    python eventLog.py run.npz    # replay server
+"""
+import json
+import sys
+import numpy as np
+
+# event kinds
+INFECT = 0  # org, other = user, attacker, value = 1 if the device became compromised
+CLEAN = 1  # org, other = user, attacker, value = 1 if the device became clean
+DETECT = 2  # org, other = user, attacker
+# The mean-field engine has no users, it records aggregate INFECT, CLEAN and DETECT events (other = -1): with an
+# attacker, value = number of employees infected, cleaned or detecting; without, value = number of devices that
+# became compromised (INFECT) or clean (CLEAN).
+SHARE_IN = 3  # org received information from other, value = amount
+SHARE_OUT = 4  # org shared information with other, value = amount
+TRUST = 5  # trust of org towards other, value = new trust
+CLOSENESS = 6  # closeness of (org, other), value = new closeness
+ARRIVAL = 7  # attacker became active
+SECURITY = 8  # org, value = new security budget
+KNOWLEDGE = 9  # org, attacker, value = number of known bits
+
+EVENT_KINDS = ["infect", "clean", "detect", "share_in", "share_out", "trust", "closeness", "arrival", "security",
+               "knowledge"]
+
+# `step` is the model step during which the event happened (the first step is 1)
+EVENT_DTYPE = np.dtype([("step", np.uint32), ("kind", np.uint8), ("org", np.int16), ("other", np.int16),
+                        ("attacker", np.int16), ("value", np.float64)])
+
+
+class EventLog:
+    """
+    Recorder of the events of a model run, in a buffer grown by doubling.
+    :param model: the model to record, its current state is the starting point of the log
+    """
+
+    def __init__(self, model, capacity=4096):
+        self.model = model
+        self.events = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.size = 0
+        state = model.org_state
+        self.meta = {
+            "start_step": model.schedule.steps,
+            "num_firms": model.num_firms,
+            "device_count": model.device_count,
+            "num_attackers": model.num_attackers,
+            "active_attacker_count": model.active_attacker_count,
+            "total_compromised": model.total_compromised,
+            "params": {name: getattr(model, name) for name in ("information_sharing", "global_seed_value",
+                                                               "reciprocity", "trust_factor",
+                                                               "security_update_interval", "acceptable_freeload")},
+        }
+        self.snapshot = {
+            "effectiveness": model.attacker_effectiveness.copy(),
+            "security_budget": state.security_budget.copy(),
+            "info_in": state.info_in.copy(),
+            "info_out": state.info_out.copy(),
+            "attacks_compromised_counts": state.attacks_compromised_counts.copy(),
+            "knowledge_counts": state.knowledge_counts.copy(),
+            "num_compromised_new": state.num_compromised_new.copy(),
+            "num_compromised_old": state.num_compromised_old.copy(),
+            "closeness_matrix": model.closeness_matrix.copy(),
+            "trust_matrix": model.trust_matrix.copy(),
+        }
+
+    def record(self, kind, org=-1, other=-1, attacker=-1, value=0.0):
+        if self.size == len(self.events):
+            self.events = np.concatenate([self.events, np.zeros(len(self.events), dtype=EVENT_DTYPE)])
+        self.events[self.size] = (self.model.schedule.steps + 1, kind, org, other, attacker, value)
+        self.size += 1
+
+    def save(self, path):
+        """Saves the log as a compressed .npz file."""
+        meta = dict(self.meta, num_steps=self.model.schedule.steps)
+        np.savez_compressed(path, events=self.events[:self.size], meta=np.array(json.dumps(meta)), **self.snapshot)
+
+
+class ReplayState:
+    """State of a replayed run at a given step: what the visualization shows."""
+
+    def __init__(self, log):
+        self.step = log.meta["start_step"]
+        self.active_attacker_count = log.meta["active_attacker_count"]
+        self.total_compromised = log.meta["total_compromised"]
+        for name in ("security_budget", "info_in", "info_out", "attacks_compromised_counts", "knowledge_counts",
+                     "num_compromised_new", "num_compromised_old", "closeness_matrix", "trust_matrix"):
+            setattr(self, name, log.snapshot[name].copy())
+
+    def copy(self):
+        state = ReplayState.__new__(ReplayState)
+        for name, value in self.__dict__.items():
+            setattr(state, name, value.copy() if isinstance(value, np.ndarray) else value)
+        return state
+
+    def apply(self, events):
+        """Applies the events of one or more consecutive steps, in order."""
+        kind = events["kind"]
+        org = events["org"].astype(np.int64)
+        other = events["other"].astype(np.int64)
+        attacker = events["attacker"].astype(np.int64)
+        value = events["value"]
+
+        sign = np.where(kind == INFECT, 1, np.where(kind == CLEAN, -1, 0))
+        aggregate = other < 0  # events of the mean-field engine, see INFECT
+        amount = sign * np.where(aggregate, value, 1).astype(np.int64)
+        attacks = (sign != 0) & (attacker >= 0)
+        np.add.at(self.attacks_compromised_counts, (org[attacks], attacker[attacks]), amount[attacks])
+        devices = (sign != 0) & np.where(aggregate, attacker < 0, value == 1)
+        np.add.at(self.num_compromised_new, org[devices], amount[devices])
+        self.total_compromised += int(amount[devices].sum())
+
+        # amounts are added one by one in event order, as the model does
+        shared = kind == SHARE_IN
+        np.add.at(self.info_in, org[shared], value[shared])
+        shared = kind == SHARE_OUT
+        np.add.at(self.info_out, org[shared], value[shared])
+
+        self.active_attacker_count += int((kind == ARRIVAL).sum())
+        _assign_last(self.trust_matrix, kind == TRUST, (org, other), value)
+        _assign_last(self.closeness_matrix, kind == CLOSENESS, (org, other), value)
+        _assign_last(self.security_budget, kind == SECURITY, (org,), value)
+        _assign_last(self.knowledge_counts, kind == KNOWLEDGE, (org, attacker), value)
+
+
+def _assign_last(array, selected, index, value):
+    """array[index] = value for the selected events, the last event wins when an entry is set several times."""
+    if not selected.any():
+        return
+    flat = np.ravel_multi_index(tuple(i[selected] for i in index), array.shape)
+    last = len(flat) - 1 - np.unique(flat[::-1], return_index=True)[1]
+    array.flat[flat[last]] = value[selected][last]
+
+
+class LoadedEventLog:
+    """An event log read back from disk, with the offsets of every step's events."""
+
+    def __init__(self, path):
+        with np.load(path) as f:
+            self.events = f["events"]
+            self.meta = json.loads(str(f["meta"]))
+            self.snapshot = {name: f[name] for name in f.files if name not in ("events", "meta")}
+        self.num_steps = self.meta["num_steps"]
+        # events of step s are events[offsets[s - start]:offsets[s - start + 1]]
+        steps = np.arange(self.meta["start_step"], self.num_steps + 2)
+        self.offsets = np.searchsorted(self.events["step"], steps, side="left")
+
+    def step_events(self, first, last):
+        """Returns the events of steps first..last (included)."""
+        start = self.meta["start_step"]
+        return self.events[self.offsets[first - start]:self.offsets[last - start + 1]]
+
+
+class ReplayModel:
+    """
+    Stand-in for CybCim built from an event log, exposing what the visualization elements read.
+    Keyframes of the state are kept every `keyframe_interval` steps, so seeking to any step only replays the
+    events since the closest keyframe.
+    :param path: path of an event log saved by EventLog.save
+    :param start_step: step to start the replay from
+    """
+
+    def __init__(self, path, start_step=0, keyframe_interval=250):
+        self.log = LoadedEventLog(path)
+        meta = self.log.meta
+        self.num_firms = meta["num_firms"]
+        self.device_count = meta["device_count"]
+        self.num_attackers = meta["num_attackers"]
+        self.attackers = [ReplayAttacker(i, e) for i, e in enumerate(self.log.snapshot["effectiveness"])]
+        self.keyframe_interval = keyframe_interval
+        self.keyframes = {meta["start_step"]: ReplayState(self.log)}
+        self.running = True
+        self.datacollector = ReplayDataCollector()
+        self.seek(max(meta["start_step"], min(int(start_step), self.log.num_steps)))
+
+    def seek(self, step):
+        """Moves the replay to the state after `step`."""
+        if not self.log.meta["start_step"] <= step <= self.log.num_steps:
+            raise IndexError("Step %d is not in the log" % step)
+        keyframe = max(s for s in self.keyframes if s <= step)
+        state = self.keyframes[keyframe].copy()
+        # replay to the next keyframes on the way, then to the step
+        next_keyframe = (state.step // self.keyframe_interval + 1) * self.keyframe_interval
+        while next_keyframe <= step:
+            self._advance(state, next_keyframe)
+            self.keyframes.setdefault(next_keyframe, state.copy())
+            next_keyframe += self.keyframe_interval
+        self._advance(state, step)
+        self.state = state
+        self.running = step < self.log.num_steps
+        self.datacollector.update(self)
+
+    def _advance(self, state, step):
+        if step <= state.step:
+            return
+        # organizations remember the number of compromised devices at the start of a step
+        state.apply(self.log.step_events(state.step + 1, step - 1))
+        state.num_compromised_old[:] = state.num_compromised_new
+        state.apply(self.log.step_events(step, step))
+        state.step = step
+
+    def step(self):
+        if self.state.step >= self.log.num_steps:
+            self.running = False
+            return
+        self._advance(self.state, self.state.step + 1)
+        if self.state.step % self.keyframe_interval == 0:
+            self.keyframes.setdefault(self.state.step, self.state.copy())
+        self.running = self.state.step < self.log.num_steps
+        self.datacollector.update(self)
+
+    # <--- attributes read by the visualization and the reporters --->
+    @property
+    def organizations(self):
+        return [ReplayOrganization(self, i) for i in range(self.num_firms)]
+
+    @property
+    def active_attacker_count(self):
+        return self.state.active_attacker_count
+
+    @property
+    def total_compromised(self):
+        return self.state.total_compromised
+
+    @property
+    def closeness_matrix(self):
+        return self.state.closeness_matrix
+
+    @property
+    def trust_matrix(self):
+        return self.state.trust_matrix
+
+    def get_closeness(self, i, j):
+        if i > j:
+            j, i = i, j
+        return self.state.closeness_matrix[i, j]
+
+
+class ReplayAttacker:
+    def __init__(self, attacker_id, effectiveness):
+        self.id = attacker_id
+        self.effectiveness = effectiveness
+
+
+class ReplayOrganization:
+    """View of an organization's replayed state, with the methods of Organization used by the visualization."""
+
+    def __init__(self, model, org_id):
+        self.model = model
+        self.id = org_id
+        self.security_budget = model.state.security_budget[org_id]
+        self.info_in = model.state.info_in[org_id]
+        self.info_out = model.state.info_out[org_id]
+
+    def get_free_loading_ratio(self):
+        return self.info_in / (self.info_in + self.info_out + 1e-5)
+
+    def get_percent_compromised(self, attack_id=None):
+        state = self.model.state
+        if attack_id is not None:
+            return state.attacks_compromised_counts[self.id, attack_id] / self.model.device_count
+        return state.num_compromised_old[self.id] / self.model.device_count
+
+    def get_info(self, attack_id):
+        return self.model.state.knowledge_counts[self.id, attack_id] / 1000
+
+
+class ReplayDataCollector:
+    """Latest values of the model reporters shown by the charts (see CybCim.collect)."""
+
+    def __init__(self):
+        self.model_vars = {}
+
+    def update(self, model):
+        from model import get_total_compromised, get_avg_closeness, get_avg_trust, get_num_attackers
+        self.model_vars = {
+            "Compromised Devices": [get_total_compromised(model)],
+            "Closeness": [get_avg_closeness(model)],
+            "Average Trust": [get_avg_trust(model)],
+            "num attackers": [get_num_attackers(model)],
+        }
+
+
+def replay_server(path):
+    """Returns a visualization server replaying the event log at `path`, starting at a step set in the UI."""
+    from mesa.visualization.ModularVisualization import ModularServer
+    from mesa.visualization.UserParam import UserSettableParameter
+    from server import card_view, composite_view
+
+    num_steps = LoadedEventLog(path).num_steps
+    params = {
+        "path": path,
+        "start_step": UserSettableParameter(param_type='slider', name='Start at step', value=0, min_value=0,
+                                            max_value=num_steps, step=1,
+                                            description='Step the replay starts from (press Reset to seek)'),
+    }
+    return ModularServer(ReplayModel, [card_view, composite_view], 'Computer Network (replay)', params)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    replay_server(sys.argv[1]).launch()
@@ -0,0 +1,183 @@
+"""
+Golden trajectories: reference runs of the model, and equivalence checks of candidate engines against them.
+
+`record` runs the current implementation for a set of parameter points (CASES) and seeds and saves, for every
+step, the metrics of STEP_FIELDS (see CybCim.iter_steps), so that any engine reporting them can be checked.
+`check` runs a candidate engine on the same cases and seeds and compares it with the
+reference:
+    - exactly, step by step, for engines that use the random numbers in the same order (any difference is
+      reported with the first step it appears at)
+    - by distribution over the seeds otherwise: for summary statistics of the runs, a two-sample
+      Kolmogorov-Smirnov test and the overlap of the confidence intervals of the means
+
+    python goldenTrajectories.py record golden.npz
+    python goldenTrajectories.py check golden.npz                                  # exact
+    python goldenTrajectories.py check golden.npz --distribution --param mean_field=True
+
+The default cases take less than a minute on a laptop. The exit code of `check` is 1 when a check fails.
+tests/golden.npz holds the reference of the default cases, checked by tests/test_goldenTrajectories.py: record it
+again when a change of the model is intended to change its trajectories.
+"""
+import argparse
+import json
+import sys
+import numpy as np
+
+from headless import parse_parameters
+from model import CybCim, STEP_FIELDS
+from statsHelpers import OnlineStats, ks_2samp
+
+# small parameter points covering sharing on and off and both random number modes
+CASES = {
+    "sharing": dict(num_firms=6, device_count=10, num_attackers_initial=3, num_attackers_total=6,
+                    max_num_steps=100),
+    "no_sharing": dict(num_firms=6, device_count=10, num_attackers_initial=3, num_attackers_total=6,
+                       max_num_steps=100, information_sharing=False),
+    "crn": dict(num_firms=6, device_count=10, num_attackers_initial=3, num_attackers_total=6, max_num_steps=100,
+                common_random_numbers=True),
+}
+SEEDS = list(range(10))
+
+TRAJECTORY_FIELDS = [field for field in STEP_FIELDS if field != "step"]
+
+
+def record_trajectory(steps, model_cls=CybCim, **params):
+    """
+    Runs a model for `steps` steps.
+    :return: field -> array with one entry per step, see TRAJECTORY_FIELDS
+    """
+    model = model_cls(collect_data=False, **params)
+    records = np.array([record[1:] for record in model.iter_steps(steps, TRAJECTORY_FIELDS)], dtype=float)
+    return {field: records[:, k] for k, field in enumerate(TRAJECTORY_FIELDS)}
+
+
+def summarize(trajectory):
+    """Summary statistics of a run, compared by the distributional check."""
+    return {
+        "compromised_final": trajectory["compromised"][-1],
+        "compromised_mean": trajectory["compromised"].mean(),
+        "trust_final": trajectory["trust"][-1],
+        "closeness_mean": trajectory["closeness"].mean(),
+        "security_final": trajectory["security"][-1],
+        "security_mean": trajectory["security"].mean(),
+        "free_loading_final": trajectory["free_loading"][-1],
+    }
+
+
+def record(path, cases=None, seeds=None, model_cls=CybCim):
+    """Records the golden trajectories of `cases` (name -> parameters) for every seed in a .npz file."""
+    cases = CASES if cases is None else cases
+    seeds = SEEDS if seeds is None else seeds
+    arrays = {}
+    for name, params in cases.items():
+        for seed in seeds:
+            trajectory = record_trajectory(params["max_num_steps"], model_cls, global_seed=True,
+                                           global_seed_value=seed, **params)
+            for field, values in trajectory.items():
+                arrays["%s/%d/%s" % (name, seed, field)] = values
+    meta = {"cases": cases, "seeds": list(seeds)}
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load(path):
+    """Returns (meta, arrays) of a golden trajectories file."""
+    with np.load(path) as f:
+        meta = json.loads(str(f["meta"]))
+        arrays = {name: f[name] for name in f.files if name != "meta"}
+    return meta, arrays
+
+
+def check_exact(path, model_cls=CybCim, **overrides):
+    """
+    Runs the candidate engine on every recorded case and seed, and compares the trajectories step by step.
+    :param overrides: parameters changed for the candidate (e.g. an engine switch)
+    :return: list of differences (case, seed, field, first step that differs), empty if the engines agree
+    """
+    meta, arrays = load(path)
+    differences = []
+    for name, params in meta["cases"].items():
+        for seed in meta["seeds"]:
+            candidate = record_trajectory(params["max_num_steps"], model_cls, global_seed=True,
+                                          global_seed_value=seed, **dict(params, **overrides))
+            for field in TRAJECTORY_FIELDS:
+                reference = arrays["%s/%d/%s" % (name, seed, field)]
+                if candidate[field].shape != reference.shape:
+                    differences.append((name, seed, field, 0))
+                    continue
+                equal = (candidate[field] == reference).reshape(len(reference), -1).all(axis=1)
+                if not equal.all():
+                    differences.append((name, seed, field, int(np.argmin(equal)) + 1))
+    return differences
+
+
+def check_distribution(path, model_cls=CybCim, alpha=0.01, confidence=0.99, seeds=None, **overrides):
+    """
+    Runs the candidate engine on every recorded case and compares the distributions over seeds of the summary
+    statistics (see summarize) with the reference.
+    :param seeds: seeds of the candidate runs (the recorded seeds if None); other seeds than the reference's
+                  check that the engines agree beyond the common random numbers
+    :return: list of (case, statistic, reference mean, candidate mean, KS p-value, whether the confidence
+             intervals of the means overlap, passed), passed when p >= alpha and the intervals overlap
+    """
+    meta, arrays = load(path)
+    seeds = meta["seeds"] if seeds is None else seeds
+    rows = []
+    for name, params in meta["cases"].items():
+        reference = [summarize({field: arrays["%s/%d/%s" % (name, seed, field)] for field in TRAJECTORY_FIELDS})
+                     for seed in meta["seeds"]]
+        candidate = [summarize(record_trajectory(params["max_num_steps"], model_cls, global_seed=True,
+                                                 global_seed_value=seed, **dict(params, **overrides)))
+                     for seed in seeds]
+        for statistic in reference[0]:
+            a = [summary[statistic] for summary in reference]
+            b = [summary[statistic] for summary in candidate]
+            _, p = ks_2samp(a, b)
+            stats_a, stats_b = OnlineStats(), OnlineStats()
+            for value in a:
+                stats_a.add(value)
+            for value in b:
+                stats_b.add(value)
+            overlap = (abs(stats_a.mean - stats_b.mean) <=
+                       stats_a.half_width(confidence) + stats_b.half_width(confidence))
+            rows.append((name, statistic, stats_a.mean, stats_b.mean, p, overlap, p >= alpha and overlap))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record golden trajectories or check an engine against them")
+    subparsers = parser.add_subparsers(dest="command")
+    record_parser = subparsers.add_parser("record", help="record the trajectories of the current implementation")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--seeds", type=int, default=len(SEEDS), help="number of seeds per case")
+    check_parser = subparsers.add_parser("check", help="check a candidate engine against recorded trajectories")
+    check_parser.add_argument("path")
+    check_parser.add_argument("--distribution", action="store_true",
+                              help="compare distributions over seeds instead of exact trajectories")
+    check_parser.add_argument("--alpha", type=float, default=0.01, help="significance level of the KS tests")
+    check_parser.add_argument("--param", action="append",
+                              help="parameter of the candidate, as name=value (e.g. mean_field=True)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.path, seeds=list(range(args.seeds)))
+        print("Recorded %d cases x %d seeds to %s" % (len(CASES), args.seeds, args.path))
+    elif args.command == "check" and args.distribution:
+        rows = check_distribution(args.path, alpha=args.alpha, **parse_parameters(args.param))
+        print("%-12s %-18s %12s %12s %8s %8s" % ("case", "statistic", "reference", "candidate", "KS p", "CI"))
+        for name, statistic, a, b, p, overlap, passed in rows:
+            print("%-12s %-18s %12.4f %12.4f %8.4f %8s %s" % (name, statistic, a, b, p,
+                                                            "overlap" if overlap else "disjoint",
+                                                            "" if passed else "FAILED"))
+        sys.exit(0 if all(row[-1] for row in rows) else 1)
+    elif args.command == "check":
+        differences = check_exact(args.path, **parse_parameters(args.param))
+        for name, seed, field, step in differences:
+            print("%s, seed %d: %s differs from step %d" % (name, seed, field, step))
+        print("trajectories are identical" if not differences else "%d differences" % len(differences))
+        sys.exit(0 if not differences else 1)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
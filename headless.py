@@ -0,0 +1,108 @@
+"""
+Headless entry point for running CybCim without the visualization stack.
+
+Importing this module only loads NumPy, Mesa's core classes and the model. networkx (graph helpers), pandas
+(DataCollector) and the tornado visualization server are only imported when actually used, so sweep workers
+reach their first step as fast as possible.
+
+    python headless.py check    # fails if importing the headless path exceeds the import-time budget
+"""
+import ast
+import json
+import os
+import subprocess
+import sys
+
+from model import CybCim, STEP_FIELDS
+from resultCache import model_parameters
+
+# maximum wall time of `import headless` in a fresh interpreter, in seconds
+IMPORT_BUDGET = 0.5
+
+# modules that must not be loaded by the headless import path
+HEAVY_MODULES = ["networkx", "pandas", "tornado", "mesa.datacollection", "mesa.batchrunner", "mesa.visualization"]
+
+
+def make_model(model=None, **params):
+    """
+    Builds a model that doesn't keep the per-step history of the DataCollector (unless asked to).
+    :param model: a model of a previous run, reset for this run instead of building a new one (see CybCim.reset)
+    """
+    params.setdefault("collect_data", False)
+    if model is not None:
+        model.reset(**model_parameters(CybCim, params))
+        return model
+    return CybCim(**params)
+
+
+def run(steps, fields=None, sink=None, **params):
+    """Runs a headless model for `steps` steps and returns the record of its last step."""
+    record = None
+    for record in make_model(**params).iter_steps(steps, fields=fields, sink=sink):
+        pass
+    return record
+
+
+def parse_parameters(pairs):
+    """
+    Parses model parameters given on the command line as name=value. Python literals (numbers, booleans, None,
+    strings, lists...) are evaluated, any other value is kept as a string.
+    """
+    params = {}
+    for pair in pairs or []:
+        name, value = pair.split("=", 1)
+        try:
+            params[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            params[name] = value
+    return params
+
+
+def launch_server():
+    """Loads the visualization stack and launches the interactive server."""
+    from server import server
+    server.launch()
+
+
+def measure_import(module="headless"):
+    """
+    Imports `module` in a fresh interpreter.
+    :return: (import time in seconds, list of HEAVY_MODULES it loaded)
+    """
+    code = ("import json, sys, time\n"
+            "started = time.perf_counter()\n"
+            "import %s\n"
+            "elapsed = time.perf_counter() - started\n"
+            "print(json.dumps([elapsed, [m for m in %r if m in sys.modules]]))\n" % (module, HEAVY_MODULES))
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed, loaded = json.loads(output.decode().strip().splitlines()[-1])
+    return elapsed, loaded
+
+
+def check_import_budget(budget=IMPORT_BUDGET, repeats=3):
+    """
+    Returns a list of problems with the headless import path: heavy modules it loads, or an import time
+    above `budget` (best of `repeats` attempts, to ignore a cold disk cache). An empty list means it passes.
+    """
+    timings = []
+    problems = []
+    for _ in range(repeats):
+        elapsed, loaded = measure_import()
+        timings.append(elapsed)
+        if loaded:
+            problems.append("headless import loaded heavy modules: %s" % ", ".join(loaded))
+            break
+    if min(timings) > budget:
+        problems.append("headless import took %.3fs, budget is %.3fs" % (min(timings), budget))
+    return problems
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["check"]:
+        problems = check_import_budget()
+        for problem in problems:
+            print(problem)
+        if not problems:
+            print("headless import path is within budget")
+        sys.exit(1 if problems else 0)
+    print(__doc__)
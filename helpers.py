@@ -1,14 +1,15 @@
-import networkx as nx
 import numpy as np
 import globalVariables
+from eventLog import SHARE_IN, SHARE_OUT
 
 
 
 def random_string(length = 8):
-    return "".join([chr(globalVariables.RNG.randint(ord("a"), ord("z"))) for _ in range(length)])
+    return "".join([chr(globalVariables.RNG().integers(ord("a"), ord("z") + 1)) for _ in range(length)])
 
 
 def random_star_graph(num_nodes, avg_node_degree):
+    import networkx as nx  # imported here so that the model itself doesn't depend on networkx
     # calculate single edge probability between two nodes
     prob = avg_node_degree / num_nodes
 
@@ -16,7 +17,8 @@ def random_star_graph(num_nodes, avg_node_degree):
     graph = nx.Graph()
     for i in range(num_nodes):
         graph.add_node(i)
-    graph.graph['gateway'] = globalVariables.RNG.choice(range(num_nodes)) # select a random node as the gateway
+    rng = globalVariables.RNG()
+    graph.graph['gateway'] = rng.integers(num_nodes) # select a random node as the gateway
     # connect all nodes to the gateway
     for i in range(num_nodes):
         if i != graph.graph['gateway']:
@@ -26,10 +28,10 @@ def random_star_graph(num_nodes, avg_node_degree):
     for i in range(0, num_nodes):
         for j in range(i+1, num_nodes):
             # if edge does not already exist and edge creation success, create edge.
-            if j not in graph[i] and globalVariables.RNG.random() < prob:
+            # the draw is made for every pair, for consistent randomness during branching
+            r = rng.random()
+            if j not in graph[i] and r < prob:
                 graph.add_edge(i, j)
-            else:
-                globalVariables.RNG.random()  # dummy, for consistent randomness during branching
 
     # the returned graph will be fully connected with a "gateway" hub node,
     # and some random connections between the other nodes.
@@ -37,8 +39,9 @@ def random_star_graph(num_nodes, avg_node_degree):
 
 
 def random_mesh_graph(num_nodes, m=3):
+    import networkx as nx
     g = nx.barabasi_albert_graph(num_nodes, m)
-    g.graph['gateway'] = globalVariables.RNG.randint(0, num_nodes-1) # pick a random node as the gateway
+    g.graph['gateway'] = globalVariables.RNG().integers(num_nodes) # pick a random node as the gateway
     return g
 
 
@@ -48,7 +51,7 @@ def get_subnetwork_device_count(model):
 
 
 def get_subnetwork_user_count(devices_count):
-    return globalVariables.RNG.randint(2, devices_count - int(devices_count/2))
+    return globalVariables.RNG().integers(2, devices_count - int(devices_count/2) + 1)
 
 # def get_subnetwork_attacker_count():
 #     return random.randint(2, 10)
@@ -105,30 +108,38 @@ def get_new_information_detected(probability, old_information, w = 0.5):
     return min(1.0, x + y**2 * (1-x)*w)
 
 def get_total_security(security_budget, deviation_width):
-    return min(1, max(0, globalVariables.RNG.normal(security_budget, deviation_width/6)))
+    return min(1, max(0, globalVariables.RNG().normal(security_budget, deviation_width/6)))
 
 def share_info_selfish(org1, org2): #org1 only shares
-    old_info_o1 = org1.old_attacks_list
-    old_info_o2 = org2.old_attacks_list
-    new_info = np.logical_or(old_info_o1, old_info_o2)
-
-    o = old_info_o1.mean(axis=1).sum()
+    o = org1.attacks_list_mean.sum()
     org2.info_in += o
     org1.info_out += o
     org1.org_out[org2.id] += o
-    org2.new_attacks_list = np.logical_or(new_info, org2.new_attacks_list)
+    org1.transmit(org2)
+    log_share(org1, org2, o, o)
 
 
 def share_info_cooperative(org1, org2): #org1 shares with org2
-    old_info_o1 = org1.old_attacks_list
-    old_info_o2 = org2.old_attacks_list
-    new_info = np.logical_or(old_info_o1, old_info_o2)
-
-    org2.info_in += np.logical_xor(new_info, old_info_o2).mean(axis=1).sum()
-    o = np.logical_xor(new_info, old_info_o1).mean(axis=1).sum()
+    # information new to org2 and to org1, only looking at the bits learned since their last exchanges
+    i = information_amount(org1.unknown_bits(org2), org2)
+    org2.info_in += i
+    o = information_amount(org2.unknown_bits(org1), org1)
     org1.info_out += o
     org1.org_out[org2.id] += o
-    org2.new_attacks_list = np.logical_or(new_info, org2.new_attacks_list)
+    org1.transmit(org2)
+    log_share(org1, org2, i, o)
+
+
+def log_share(org1, org2, info_in, info_out):
+    log = org1.model.event_log
+    if log is not None:
+        log.record(SHARE_IN, org2.id, org1.id, value=info_in)
+        log.record(SHARE_OUT, org1.id, org2.id, value=info_out)
+
+
+def information_amount(bits, org):
+    """ bits: flat knowledge indices (attack * 1000 + bit), returns the sum over attacks of the known fraction """
+    return (np.bincount(bits // 1000, minlength=org.model.num_attackers) / 1000).sum()
 
 def free_loading_ratio_v1(info_in, info_out):
     return info_in / (info_in + info_out + 1e-5)
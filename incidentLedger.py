@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class IncidentLedger:
+    """
+    Columnar record of the security incidents of a run.
+
+    An incident of an organization for an attack starts when one of its employees detects the attack while the
+    organization isn't aware of it, and ends when the last device compromised by the attack is cleaned (the
+    organization isn't aware of it anymore). Every incident is a row of preallocated columns, grown by doubling,
+    so recording is O(1) and the reporters are vectorized over all incidents.
+    :param handled_within: incidents lasting longer than this number of steps are unhandled
+    """
+
+    def __init__(self, num_firms, num_attackers, handled_within, capacity=256):
+        self.handled_within = handled_within
+        self.org = np.zeros(capacity, dtype=np.int32)
+        self.attacker = np.zeros(capacity, dtype=np.int32)
+        self.start = np.zeros(capacity, dtype=np.int64)
+        self.last_update = np.zeros(capacity, dtype=np.int64)
+        self.detections = np.zeros(capacity, dtype=np.int64)
+        self.end = np.zeros(capacity, dtype=np.int64)  # -1 while the incident is open
+        self.open = np.full((num_firms, num_attackers), -1, dtype=np.int64)  # row of each open incident
+        self.size = 0
+
+    COLUMNS = ["org", "attacker", "start", "last_update", "detections", "end"]
+
+    def clear(self):
+        """Forgets every incident, keeping the columns for a new run."""
+        self.open.fill(-1)
+        self.size = 0
+
+    def _grow(self, needed):
+        capacity = len(self.org)
+        while capacity < needed:
+            capacity *= 2
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def detect(self, org, attacker, step, count=1):
+        """Records `count` detections of `attacker` by employees of `org`, starting an incident if none is open."""
+        row = self.open[org, attacker]
+        if row < 0:
+            if self.size == len(self.org):
+                self._grow(self.size + 1)
+            row = self.size
+            self.size += 1
+            self.org[row] = org
+            self.attacker[row] = attacker
+            self.start[row] = step
+            self.detections[row] = 0
+            self.end[row] = -1
+            self.open[org, attacker] = row
+        self.detections[row] += count
+        self.last_update[row] = step
+
+    def detect_many(self, detections, step):
+        """Records detections[org, attacker] detections of every attack by every organization."""
+        new = (detections > 0) & (self.open < 0)
+        orgs, attackers = np.nonzero(new)
+        if len(orgs):
+            if self.size + len(orgs) > len(self.org):
+                self._grow(self.size + len(orgs))
+            rows = np.arange(self.size, self.size + len(orgs))
+            self.size += len(orgs)
+            self.org[rows] = orgs
+            self.attacker[rows] = attackers
+            self.start[rows] = step
+            self.detections[rows] = 0
+            self.end[rows] = -1
+            self.open[orgs, attackers] = rows
+        orgs, attackers = np.nonzero(detections > 0)
+        rows = self.open[orgs, attackers]
+        self.detections[rows] += detections[orgs, attackers]
+        self.last_update[rows] = step
+
+    def close(self, org, attacker, step):
+        """Ends the open incident of `org` for `attacker`, if any."""
+        row = self.open[org, attacker]
+        if row >= 0:
+            self.end[row] = step
+            self.last_update[row] = step
+            self.open[org, attacker] = -1
+
+    def close_many(self, ended, step):
+        """Ends the open incidents of the (org, attacker) entries where `ended` is True."""
+        rows = self.open[ended]
+        rows = rows[rows >= 0]
+        self.end[rows] = step
+        self.last_update[rows] = step
+        self.open[ended] = -1
+
+    # <--- reporters --->
+    def durations(self, step):
+        """Duration of every incident, up to `step` for the open ones."""
+        end = self.end[:self.size]
+        return np.where(end < 0, step, end) - self.start[:self.size]
+
+    def mean_duration(self, step, num_firms=None):
+        """
+        Average duration of the ended incidents (0 without any), or per organization if `num_firms` is given.
+        """
+        ended = self.end[:self.size] >= 0
+        durations = self.durations(step)[ended]
+        if num_firms is None:
+            return durations.mean() if len(durations) else 0.0
+        orgs = self.org[:self.size][ended]
+        counts = np.bincount(orgs, minlength=num_firms)
+        return np.bincount(orgs, weights=durations, minlength=num_firms) / np.maximum(counts, 1)
+
+    def unhandled_rate(self, step, num_firms=None):
+        """
+        Fraction of the incidents (open ones included) lasting longer than `handled_within` steps (0 without
+        any), or per organization if `num_firms` is given.
+        """
+        unhandled = self.durations(step) > self.handled_within
+        if num_firms is None:
+            return unhandled.mean() if self.size else 0.0
+        orgs = self.org[:self.size]
+        counts = np.bincount(orgs, minlength=num_firms)
+        return np.bincount(orgs, weights=unhandled, minlength=num_firms) / np.maximum(counts, 1)
+
+    def as_dict(self):
+        """Returns the recorded incidents as a dictionary of columns."""
+        return {name: getattr(self, name)[:self.size].copy() for name in self.COLUMNS}
@@ -0,0 +1,258 @@
+"""
+Local load test of the visualization server.
+
+The server of server.py (or a SessionServer with `--sessions`) is started in a separate process for every number
+of firms, and N simulated browsers connect to its websocket and drive the Mesa protocol: get_params, reset, then
+one get_step after the other (a reset when the model ends). The clients start requesting frames together, once
+all of them are connected and reset. For every number of firms and clients, the latency of the frames (from
+get_step to the rendered viz_state), their payload size and the CPU used by the server process (read from /proc,
+Linux only) are reported.
+
+    python loadTest.py run --firms 12 25 50 --clients 1 4 16 --frames 50 --csv load.csv
+
+With server.py, all the clients share (and step) the same model, as browsers connected to it do: only the first
+client resets it, at the start and when it ends.
+"""
+import argparse
+import csv
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+
+from headless import parse_parameters
+
+FIELDS = ["num_firms", "clients", "frames", "p50_ms", "p90_ms", "p99_ms", "max_ms", "mean_bytes", "max_bytes",
+          "frames_per_s", "server_cpu"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_cpu_seconds(pid):
+    """Returns the user + system CPU time used by the process `pid` so far (None without /proc)."""
+    try:
+        with open("/proc/%d/stat" % pid) as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are the 14th and 15th fields, the remaining fields start with the 3rd
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def serve(port, sessions=False, workers=4, params=None):
+    """Runs the visualization server on `port` until killed, with the given model parameter values."""
+    import tornado.ioloop
+    from mesa.visualization.UserParam import UserSettableParameter
+    from model import CybCim
+    from server import server, model_params, elements
+
+    app = server
+    if sessions:
+        from sessionServer import SessionServer
+        app = SessionServer(CybCim, elements, 'Computer Network', model_params, workers=workers,
+                            max_sessions=1000)
+    app.verbose = False
+    for name, value in (params or {}).items():
+        if isinstance(app.model_kwargs.get(name), UserSettableParameter):
+            app.model_kwargs[name].value = value
+        else:
+            app.model_kwargs[name] = value
+    app.reset_model()
+    app.listen(port, "127.0.0.1")
+    tornado.ioloop.IOLoop.current().start()
+
+
+class ServerProcess:
+    """The server, started by this script in a separate process."""
+
+    def __init__(self, sessions=False, workers=4, params=None, timeout=60):
+        self.port = free_port()
+        self.sessions = sessions
+        command = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(self.port),
+                   "--workers", str(workers)]
+        if sessions:
+            command.append("--sessions")
+        for name, value in (params or {}).items():
+            command += ["--param", "%s=%s" % (name, value)]
+        # server.py loads the templates relatively to the repository
+        self.process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.wait_listening(timeout)
+
+    @property
+    def url(self):
+        return "ws://127.0.0.1:%d/ws" % self.port
+
+    def wait_listening(self, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("The server exited with code %d" % self.process.returncode)
+            try:
+                socket.create_connection(("127.0.0.1", self.port), 0.5).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("The server didn't start within %d seconds" % timeout)
+
+    def cpu_seconds(self):
+        return process_cpu_seconds(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class Barrier:
+    """Blocks the clients until `parties` of them are waiting (asyncio.Barrier needs Python 3.11)."""
+
+    def __init__(self, parties):
+        import tornado.locks
+        self.parties = parties
+        self.waiting = 0
+        self.event = tornado.locks.Event()
+
+    async def wait(self):
+        self.waiting += 1
+        if self.waiting >= self.parties:
+            self.event.set()
+        await self.event.wait()
+
+
+async def run_client(url, frames, latencies, sizes, reset=True, barrier=None):
+    """
+    A simulated browser: resets the model, then requests `frames` frames one after the other.
+    :param reset: whether this client resets the model (at the start and when it ends), only one client resets a
+                  model shared by the clients
+    :param barrier: Barrier the client waits at before requesting frames
+    """
+    from tornado.websocket import websocket_connect
+    conn = await websocket_connect(url)
+    try:
+        conn.write_message(json.dumps({"type": "get_params"}))
+        await conn.read_message()
+        if reset:
+            conn.write_message(json.dumps({"type": "reset"}))
+            await conn.read_message()
+        if barrier is not None:
+            await barrier.wait()
+        for step in range(frames):
+            start = time.perf_counter()
+            conn.write_message(json.dumps({"type": "get_step", "step": step}))
+            message = await conn.read_message()
+            if message is None:  # closed by the server
+                break
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(message.encode()))
+            if reset and json.loads(message)["type"] == "end":
+                conn.write_message(json.dumps({"type": "reset"}))
+                await conn.read_message()
+    finally:
+        conn.close()
+
+
+def measure(server, num_firms, clients, frames):
+    """Runs `clients` concurrent clients against `server` and returns a row of FIELDS."""
+    import tornado.gen
+    import tornado.ioloop
+    latencies, sizes = [], []
+    barrier = Barrier(clients)
+
+    async def run_all():
+        # the clients of server.py share its model, only the first one resets it
+        await tornado.gen.multi([run_client(server.url, frames, latencies, sizes, server.sessions or k == 0,
+                                            barrier) for k in range(clients)])
+
+    cpu = server.cpu_seconds()
+    start = time.perf_counter()
+    tornado.ioloop.IOLoop.current().run_sync(run_all)
+    elapsed = time.perf_counter() - start
+    if cpu is not None:
+        cpu = (server.cpu_seconds() - cpu) / elapsed  # cores used, 1 = one core busy
+
+    latencies = np.array(latencies) * 1000
+    sizes = np.array(sizes)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (np.nan,) * 3
+    return {
+        "num_firms": num_firms, "clients": clients, "frames": len(latencies),
+        "p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "max_ms": latencies.max() if len(latencies) else np.nan,
+        "mean_bytes": sizes.mean() if len(sizes) else np.nan, "max_bytes": sizes.max() if len(sizes) else np.nan,
+        "frames_per_s": len(latencies) / elapsed, "server_cpu": cpu,
+    }
+
+
+def load_test(firms=(12,), clients=(1, 4, 16), frames=50, sessions=False, workers=4, params=None):
+    """
+    Measures the server for every number of firms and of clients (see measure).
+    :param params: other model parameters of the server
+    :return: list of rows of FIELDS
+    """
+    rows = []
+    for num_firms in firms:
+        server = ServerProcess(sessions, workers, dict(params or {}, num_firms=num_firms))
+        try:
+            measure(server, num_firms, 1, 2)  # warm up: page in the modules, build the first model
+            for n in clients:
+                rows.append(measure(server, num_firms, n, frames))
+                print("%(num_firms)5d firms %(clients)4d clients: p50 %(p50_ms)8.1f ms  p99 %(p99_ms)8.1f ms  "
+                      "%(mean_bytes)9.0f bytes  %(frames_per_s)7.1f frames/s" % rows[-1])
+        finally:
+            server.stop()
+    return rows
+
+
+def print_table(rows):
+    print("%6s %7s %7s %9s %9s %9s %9s %10s %10s %9s %7s" % tuple(FIELDS))
+    for row in rows:
+        cpu = "-" if row["server_cpu"] is None else "%.2f" % row["server_cpu"]
+        print("%6d %7d %7d %9.1f %9.1f %9.1f %9.1f %10.0f %10.0f %9.1f %7s" %
+              (tuple(row[field] for field in FIELDS[:-1]) + (cpu,)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the visualization server")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="measure the server with simulated clients")
+    run_parser.add_argument("--firms", type=int, nargs="+", default=[12], help="numbers of firms to measure")
+    run_parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16],
+                            help="numbers of concurrent clients to measure")
+    run_parser.add_argument("--frames", type=int, default=50, help="frames requested by every client")
+    run_parser.add_argument("--sessions", action="store_true",
+                            help="measure a SessionServer (one model per client) instead of server.py")
+    run_parser.add_argument("--workers", type=int, default=4, help="workers of the SessionServer")
+    run_parser.add_argument("--param", action="append", help="model parameter, as name=value")
+    run_parser.add_argument("--csv", help="also write the results to this csv file")
+    serve_parser = subparsers.add_parser("serve", help="run the server (started by `run`)")
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--sessions", action="store_true")
+    serve_parser.add_argument("--workers", type=int, default=4)
+    serve_parser.add_argument("--param", action="append")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        rows = load_test(args.firms, args.clients, args.frames, args.sessions, args.workers,
+                         parse_parameters(args.param))
+        print_table(rows)
+        if args.csv:
+            with open(args.csv, "w", newline="") as f:
+                writer = csv.DictWriter(f, FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+    elif args.command == "serve":
+        serve(args.port, args.sessions, args.workers, parse_parameters(args.param))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
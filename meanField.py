@@ -0,0 +1,75 @@
+"""
+Validation of the mean-field engine (CybCim(mean_field=True), see agents/population.py) against the agent engine.
+
+Both engines are run over the same seeds on a small case, with and without information sharing (unless
+information_sharing is given), and the distributions over seeds of every STEP_FIELDS metric, at the end of the runs
+and averaged over the runs, are compared with a two-sample Kolmogorov-Smirnov test.
+
+The mean-field engine samples whether a device is compromised by any attack assuming the attacks independent, while
+in the agent engine they spread over the same coworkers. The compromised devices have compatible distributions for
+organizations of 4 to 30 devices (checked with and without sharing), but their spread over seeds is smaller with the
+mean-field engine: about a quarter of the agent engine's on the no_sharing case of goldenTrajectories.py.
+
+    python meanField.py --runs 30 --steps 300 --param device_count=20
+"""
+import argparse
+import numpy as np
+
+from model import CybCim, STEP_FIELDS
+from statsHelpers import ks_2samp
+from headless import parse_parameters
+
+
+def run_metrics(steps, fields, **params):
+    """Runs a model and returns (final value, time average) of every field."""
+    params.setdefault("max_num_steps", steps)
+    model = CybCim(collect_data=False, **params)
+    records = np.array([record[1:] for record in model.iter_steps(steps, fields)], dtype=float)
+    return records[-1], records.mean(axis=0)
+
+
+def validate(runs=30, steps=300, fields=None, alpha=0.01, **params):
+    """
+    Runs both engines with seeds 0..runs - 1 and compares their metrics.
+    :param fields: names of STEP_FIELDS with scalar values to compare (all of them if None)
+    :return: list of (information sharing, field, statistic ("final" or "mean"), agent engine mean, mean-field
+             mean, KS statistic, p-value, whether the distributions are compatible at level `alpha`)
+    """
+    if fields is None:
+        fields = [f for f in STEP_FIELDS if f not in ("step", "num_attackers", "active_attackers")]
+    sharing_values = [params.pop("information_sharing")] if "information_sharing" in params else [True, False]
+    rows = []
+    for sharing in sharing_values:
+        samples = {}
+        for mean_field in (False, True):
+            results = [run_metrics(steps, fields, global_seed=True, global_seed_value=seed, mean_field=mean_field,
+                                   information_sharing=sharing, **params) for seed in range(runs)]
+            samples[mean_field] = (np.array([final for final, _ in results]),
+                                   np.array([mean for _, mean in results]))
+
+        for k, field in enumerate(fields):
+            for s, statistic in enumerate(("final", "mean")):
+                a = samples[False][s][:, k]
+                b = samples[True][s][:, k]
+                d, p = ks_2samp(a, b)
+                rows.append((sharing, field, statistic, a.mean(), b.mean(), d, p, p >= alpha))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the mean-field engine with the agent engine")
+    parser.add_argument("--runs", type=int, default=30, help="number of seeds per engine")
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--alpha", type=float, default=0.01, help="significance level of the KS tests")
+    parser.add_argument("--param", action="append", help="model parameter, as name=value")
+    args = parser.parse_args()
+
+    rows = validate(args.runs, args.steps, alpha=args.alpha, **parse_parameters(args.param))
+    print("%-8s %-14s %-6s %12s %12s %8s %8s" % ("sharing", "field", "stat", "agents", "mean-field", "KS", "p"))
+    for sharing, field, statistic, a, b, d, p, ok in rows:
+        print("%-8s %-14s %-6s %12.4f %12.4f %8.3f %8.4f %s" % (sharing, field, statistic, a, b, d, p,
+                                                               "" if ok else "DIFFERENT"))
+
+
+if __name__ == "__main__":
+    main()
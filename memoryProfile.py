@@ -0,0 +1,266 @@
+"""
+Memory accounting of CybCim, per subsystem, and extrapolation to larger scenarios.
+
+    python memoryProfile.py profile --steps 200 --param num_firms=12
+    python memoryProfile.py estimate --steps 1000 --param num_firms=100 --param device_count=500
+"""
+import argparse
+import sys
+import tracemalloc
+import types
+import numpy as np
+from mesa import Agent, Model
+import mesa.datacollection  # the model imports it lazily, importing it here keeps it out of the traced memory
+
+from model import CybCim, RandomCallCounter
+from headless import parse_parameters
+from resultCache import model_parameters
+
+SUBSYSTEMS = ["employees", "attackers", "organizations.knowledge", "organizations.permutations",
+              "organizations.other", "matrices", "datacollector", "scheduler", "model_lists"]
+
+# objects that are accounted for in their own subsystem (or not owned by the model) and aren't followed
+_OPAQUE = (Agent, Model, RandomCallCounter, np.random.Generator, types.FunctionType, types.MethodType,
+           types.BuiltinFunctionType, types.ModuleType, type)
+
+# extrapolation features of each subsystem's size after construction, as functions of
+# (num_firms, device_count, num_attackers_total); a constant term is always added
+SIZE_FEATURES = {
+    "employees": lambda f, d, a: [f * d, f * d * a],
+    "attackers": lambda f, d, a: [a, a * f],
+    "organizations.knowledge": lambda f, d, a: [f * a],
+    "organizations.permutations": lambda f, d, a: [f * a],
+    "organizations.other": lambda f, d, a: [f, f * f, f * a, f * d],
+    "matrices": lambda f, d, a: [f * f],
+    "datacollector": lambda f, d, a: [],
+    "scheduler": lambda f, d, a: [f * d + a],
+    "model_lists": lambda f, d, a: [f * f, f * d, a],
+    "traced": lambda f, d, a: [f, f * f, f * a, f * d, f * d * a],
+}
+# features of the growth per step: the model-level lists grow by one entry per organization and step
+GROWTH_FEATURES = lambda f, d, a: [f]
+
+# small configurations the extrapolation is fitted on (full factorial design, three levels of organizations for
+# the pairwise terms)
+PROBE_LEVELS = {"num_firms": (3, 6, 9), "device_count": (8, 16), "num_attackers_total": (4, 8)}
+
+_SCALARS = (int, float, complex, bool, str, bytes, type(None), np.generic)
+
+
+def deep_sizeof(obj, seen=None, root=True):
+    """
+    Returns the number of bytes held by `obj` and the containers and arrays it references.
+    Agents, models, random streams and functions are not followed (except `obj` itself), and array views only
+    count their header, their data being owned by another array. Scalars are counted at every reference, even
+    when python shares them (small integers), so that sizes scale linearly with the number of objects.
+    """
+    if isinstance(obj, _SCALARS):
+        return sys.getsizeof(obj)
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if not root and isinstance(obj, _OPAQUE):
+        return 0
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen, False) + deep_sizeof(value, seen, False)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_sizeof(item, seen, False)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(obj.__dict__, seen, False)
+    return size
+
+
+def subsystem_bytes(model):
+    """Returns the number of bytes held by each subsystem of `model` (see SUBSYSTEMS)."""
+    state = model.org_state
+    sizes = dict.fromkeys(SUBSYSTEMS, 0)
+
+    seen = set()
+    if model.employee_compromisers is not None:
+        sizes["employees"] = model.employee_compromisers.nbytes  # the employees' rows are views of the pool
+    for org in model.organizations:
+        for user in org.users:
+            sizes["employees"] += deep_sizeof(user, seen)
+    for attacker in model.attackers:
+        sizes["attackers"] += deep_sizeof(attacker, seen)
+
+    sizes["organizations.knowledge"] = (state.old_attacks_list.nbytes + state.new_attacks_list.nbytes +
+                                        state.attacks_list_mean.nbytes + state.knowledge_counts.nbytes +
+                                        state.knowledge_log.nbytes + deep_sizeof(state.pending_bits))
+    sizes["organizations.permutations"] = (state.attacks_list_predetermined.nbytes +
+                                           state.attacks_list_predetermined_idx.nbytes)
+    counted = {id(state.old_attacks_list), id(state.new_attacks_list), id(state.attacks_list_mean),
+               id(state.knowledge_counts), id(state.knowledge_log), id(state.pending_bits),
+               id(state.attacks_list_predetermined), id(state.attacks_list_predetermined_idx)}
+    sizes["organizations.other"] = deep_sizeof(state, counted)
+    sizes["organizations.other"] += (model.detection_prob_untargeted.nbytes + model.detection_prob_targeted.nbytes +
+                                     model.attacker_effectiveness.nbytes)
+    for org in model.organizations:
+        sizes["organizations.other"] += deep_sizeof(org, seen)
+
+    sizes["matrices"] = model.closeness_matrix.nbytes + model.trust_matrix.nbytes
+    if model.datacollector is not None:
+        sizes["datacollector"] = deep_sizeof(model.datacollector)
+    sizes["scheduler"] = deep_sizeof(model.schedule)
+    for name in ("organizations", "users", "attackers", "pairs", "pair_rngs", "newly_compromised_per_step",
+                 "incidents", "attack_generation_steps"):
+        sizes["model_lists"] += deep_sizeof(getattr(model, name))
+    return sizes
+
+
+class MemoryReport:
+    """
+    Memory used by a model run.
+    :param construction: bytes of each subsystem after construction (plus "traced", allocated by the constructor
+                         according to tracemalloc)
+    :param final: bytes of each subsystem after the run (plus "traced", allocated since the construction started)
+    :param steps: number of steps run
+    :param peak: peak traced bytes during the run
+    """
+
+    def __init__(self, params, construction, final, steps, peak=None):
+        self.params = params
+        self.construction = construction
+        self.final = final
+        self.steps = steps
+        self.peak = peak
+
+    def growth_per_step(self):
+        """Average growth in bytes per step of each subsystem (and of the traced memory)."""
+        if not self.steps:
+            return dict.fromkeys(self.final, 0.0)
+        return {name: (self.final[name] - self.construction[name]) / self.steps for name in self.final}
+
+    def total(self):
+        return sum(self.final[name] for name in SUBSYSTEMS)
+
+    def format(self):
+        growth = self.growth_per_step()
+        lines = ["%-28s %14s %14s %14s" % ("subsystem", "after build", "after %d steps" % self.steps, "per step")]
+        for name in SUBSYSTEMS + ["traced"]:
+            lines.append("%-28s %14s %14s %14s" % (name, format_bytes(self.construction[name]),
+                                                   format_bytes(self.final[name]), format_bytes(growth[name])))
+        lines.append("%-28s %14s %14s" % ("total accounted", format_bytes(sum(self.construction[n] for n in SUBSYSTEMS)),
+                                          format_bytes(self.total())))
+        if self.peak is not None:
+            lines.append("%-28s %14s" % ("peak traced", format_bytes(self.peak)))
+        return "\n".join(lines)
+
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num_bytes) < 1024:
+            return "%.1f %s" % (num_bytes, unit)
+        num_bytes /= 1024
+    return "%.1f TiB" % num_bytes
+
+
+def profile(steps=100, **params):
+    """
+    Builds a model with `params`, runs it for `steps` steps under tracemalloc and returns its MemoryReport.
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    if hasattr(tracemalloc, "reset_peak"):  # python >= 3.9
+        tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    model = CybCim(**params)
+    built = tracemalloc.get_traced_memory()[0]
+    construction = subsystem_bytes(model)
+    construction["traced"] = built - start
+
+    for _ in range(steps):
+        model.step()
+    current, peak = tracemalloc.get_traced_memory()
+    if not was_tracing:
+        tracemalloc.stop()
+    final = subsystem_bytes(model)
+    final["traced"] = current - start
+    return MemoryReport(params, construction, final, steps, peak - start)
+
+
+def _scale(params):
+    full = model_parameters(CybCim, params)
+    return full["num_firms"], full["device_count"], full["num_attackers_total"]
+
+
+def fit_scaling(steps=20, **params):
+    """
+    Profiles the small PROBE_LEVELS configurations (with the other parameters set to `params`) and fits how the
+    size after construction and the growth per step of every subsystem scale with the number of organizations,
+    devices and attackers.
+    :return: subsystem -> (construction coefficients, growth coefficients), for the features of SIZE_FEATURES and
+             GROWTH_FEATURES preceded by a constant term
+    """
+    reports = []
+    for f in PROBE_LEVELS["num_firms"]:
+        for d in PROBE_LEVELS["device_count"]:
+            for a in PROBE_LEVELS["num_attackers_total"]:
+                probe = dict(params, num_firms=f, device_count=d, num_attackers_total=a)
+                probe["num_attackers_initial"] = min(model_parameters(CybCim, probe)["num_attackers_initial"], a)
+                reports.append(((f, d, a), profile(steps, **probe)))
+
+    coefficients = {}
+    for name in SUBSYSTEMS + ["traced"]:
+        x = np.array([[1] + SIZE_FEATURES[name](*scale) for scale, _ in reports], dtype=float)
+        y = np.array([report.construction[name] for _, report in reports], dtype=float)
+        size_coef = np.linalg.lstsq(x, y, rcond=None)[0]
+        x = np.array([[1] + GROWTH_FEATURES(*scale) for scale, _ in reports], dtype=float)
+        y = np.array([report.growth_per_step()[name] for _, report in reports], dtype=float)
+        growth_coef = np.linalg.lstsq(x, y, rcond=None)[0]
+        coefficients[name] = (size_coef, growth_coef)
+    return coefficients
+
+
+def estimate(steps, coefficients=None, **params):
+    """
+    Extrapolates the memory of a run of `steps` steps with `params` (typically large num_firms, device_count
+    and num_attackers_total) without building it.
+    :param coefficients: result of fit_scaling, fitted with the other parameters of `params` if None
+    :return: subsystem -> estimated bytes at the end of the run (plus "traced")
+    """
+    if coefficients is None:
+        small = {k: v for k, v in params.items() if k not in PROBE_LEVELS and k != "num_attackers_initial"}
+        coefficients = fit_scaling(**small)
+    scale = _scale(params)
+    estimates = {}
+    for name, (size_coef, growth_coef) in coefficients.items():
+        size = np.dot(size_coef, [1] + SIZE_FEATURES[name](*scale))
+        growth = np.dot(growth_coef, [1] + GROWTH_FEATURES(*scale))
+        estimates[name] = max(0.0, size + growth * steps)
+    return estimates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory accounting of CybCim runs")
+    subparsers = parser.add_subparsers(dest="command")
+    profile_parser = subparsers.add_parser("profile", help="measure the memory of a run per subsystem")
+    profile_parser.add_argument("--steps", type=int, default=100)
+    profile_parser.add_argument("--param", action="append", help="model parameter, as name=value")
+    estimate_parser = subparsers.add_parser("estimate", help="extrapolate the memory of a large run")
+    estimate_parser.add_argument("--steps", type=int, default=1000)
+    estimate_parser.add_argument("--param", action="append", help="model parameter, as name=value")
+    args = parser.parse_args()
+
+    if args.command == "profile":
+        print(profile(args.steps, **parse_parameters(args.param)).format())
+    elif args.command == "estimate":
+        estimates = estimate(args.steps, **parse_parameters(args.param))
+        for name in SUBSYSTEMS + ["traced"]:
+            print("%-28s %14s" % (name, format_bytes(estimates[name])))
+        print("%-28s %14s" % ("total accounted", format_bytes(sum(estimates[name] for name in SUBSYSTEMS))))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
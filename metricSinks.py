@@ -0,0 +1,52 @@
+import json
+import socket
+import numpy as np
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    return value
+
+
+class JsonLinesSink:
+    """Writes every record as one line of JSON to a file (path or open text file)."""
+
+    def __init__(self, file, flush_every=1):
+        if isinstance(file, str):
+            self.file = open(file, "a")
+            self.owns_file = True
+        else:
+            self.file = file
+            self.owns_file = False
+        self.flush_every = flush_every
+        self.count = 0
+
+    def write(self, record):
+        self.file.write(json.dumps({k: _to_json(v) for k, v in record.items()}) + "\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.flush()
+        if self.owns_file:
+            self.file.close()
+
+
+class SocketSink:
+    """Sends every record as one line of JSON over a TCP connection (e.g. to a monitoring agent)."""
+
+    def __init__(self, host, port, timeout=10):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+
+    def write(self, record):
+        line = json.dumps({k: _to_json(v) for k, v in record.items()}) + "\n"
+        self.socket.sendall(line.encode())
+
+    def close(self):
+        self.socket.close()
@@ -1,12 +1,15 @@
 from mesa import Model
-from mesa.time import SimultaneousActivation
-from mesa.datacollection import DataCollector
-from agents.subnetworks import Organization
+from agents.subnetworks import Organization, OrganizationState, BatchedOrganizationActivation
 from agents.agents import Attacker
+from agents.population import EmployeePopulation
 from helpers import *
+from eventLog import ARRIVAL, TRUST, CLOSENESS
+from incidentLedger import IncidentLedger
+import inspect
 import numpy as np
 import time
 import globalVariables
+from collections import namedtuple
 
 
 # Data collector function for total compromised
@@ -75,8 +78,12 @@ def get_avg_free_loading(model):
     return sum(get_free_loading(model)) / len(get_free_loading(model))
 
 
-def get_avg_incident_time(model):  #TODO to be called somewhere (called in batchrunner)
-    return sum(model.incident_times)/len(model.incident_times)
+def get_avg_incident_time(model):
+    return model.incidents.mean_duration(model.schedule.time)
+
+
+def get_unhandled_incident_rate(model):
+    return model.incidents.unhandled_rate(model.schedule.time)
 
 
 def get_security_per_org(model): # TODO used in subnetworks instead
@@ -101,6 +108,27 @@ def get_total_avg_security(model):
 def get_num_attackers(model):
     return model.num_attackers
 
+def get_step(model):
+    return model.schedule.steps
+
+
+def get_active_attackers(model):
+    return model.active_attacker_count
+
+
+# per-step metrics available to CybCim.iter_steps, by field name
+STEP_FIELDS = {
+    "step": get_step,
+    "compromised": get_total_compromised,
+    "closeness": get_avg_closeness,
+    "trust": get_avg_trust,
+    "security": get_total_avg_security,
+    "free_loading": get_avg_free_loading,
+    "num_attackers": get_num_attackers,
+    "active_attackers": get_active_attackers,
+}
+
+
 class RandomCallCounter:
     def __init__(self, generator):
         self.generator = generator
@@ -110,8 +138,43 @@ class RandomCallCounter:
         self.call_count += 1
         return self.generator
 
+    def skip(self, count):
+        """
+        Advances the stream by making `count` uniform draws.
+
+        Runs without sharing skip the 3 draws per pair of organizations of the sharing game, O(num_firms^2) draws
+        per step: about 75us for 100 organizations, 5ms for 1000. Giving the sharing game a stream of its own
+        would avoid them, but would change the random numbers of every run with sharing.
+        """
+        # draws rather than bit_generator.advance, which drops the buffered half word of the bounded integer draws
+        self.generator.random(count)
+
+
+# arrays of a model reused by CybCim.reset
+RECYCLED_ARRAYS = ["avg_newly_compromised_per_org", "employee_compromisers", "detection_prob_untargeted",
+                   "detection_prob_targeted", "closeness_matrix", "trust_matrix"]
+
+
+def reuse_array(recycled, name, shape, dtype=float, fill=0):
+    """Returns an array filled with `fill`: the array `name` of `recycled` if compatible, a new one otherwise."""
+    array = recycled.get(name)
+    if array is None or array.shape != shape or array.dtype != dtype:
+        return np.full(shape, fill, dtype=dtype)
+    array.fill(fill)
+    return array
+
 
 class CybCim(Model):
+    # parameters that only affect a run for some values of other parameters: name -> {parameter: values for which
+    # it is relevant}. Sweeps run configurations that only differ by irrelevant parameters once (see
+    # resultCache.relevant_parameters). Without sharing the trust and closeness matrices keep their initial values,
+    # which the reporters read, so initial_trust and initial_closeness always matter.
+    PARAMETER_DEPENDENCIES = {
+        "reciprocity": {"information_sharing": (True,)},
+        "trust_factor": {"information_sharing": (True,)},
+        "acceptable_freeload": {"information_sharing": (True,)},
+    }
+
 
     def __init__(self,
                  verbose=False,
@@ -134,11 +197,19 @@ class CybCim(Model):
                  acceptable_freeload=0.5,
                  # fixed_attack_effectiveness_value=0.5,
                  global_seed=True,
-                 global_seed_value=1987):
+                 global_seed_value=1987,
+                 common_random_numbers=False,
+                 collect_data=True,
+                 mean_field=False,
+                 async_collection=False):
 
         # global globalVariables.VERBOSE
         # global globalVariables.GLOBAL_SEED
         super().__init__()
+        # the parameters of the run, reset() builds the model again from them
+        self.params = {name: value for name, value in locals().items() if name in CybCim.PARAMETERS}
+        # buffers of the previous run when the model is reset, reused if their shapes allow it
+        recycled = self.__dict__.pop("_recycled", {})
 
         self.verbose = verbose  # adjustable parameter
         self.global_seed = global_seed  # adjustable parameter
@@ -165,11 +236,35 @@ class CybCim(Model):
         # self.fixed_attack_effectiveness_value = fixed_attack_effectiveness_value  # adjustable parameter
         self.global_seed_value = global_seed_value  # adjustable parameter
         globalVariables.GLOBAL_SEED_VALUE = global_seed_value
+        self.collect_data = collect_data  # whether the DataCollector keeps the history of every step
+        # whether the reporters run on a background thread (True) or process ("process"), see asyncCollection.py
+        self.async_collection = async_collection
+        # approximate engine tracking compromised counts instead of individual employees (see agents/population.py)
+        self.mean_field = mean_field
 
         if globalVariables.GLOBAL_SEED:
-            globalVariables.RNG = RandomCallCounter(np.random.default_rng(globalVariables.GLOBAL_SEED_VALUE))
+            seed = globalVariables.GLOBAL_SEED_VALUE
+        else:
+            seed = int(time.time())
+
+        # With common random numbers, the model, every organization (and each of its employees), every attacker
+        # and every pair of organizations draw from independent streams spawned from the seed. Runs that only
+        # differ in a component (e.g. sharing on and off) then use the same random numbers everywhere else.
+        # Otherwise, every component shares the single global stream of the model.
+        self.common_random_numbers = common_random_numbers  # adjustable parameter
+        self.pairs = [(i, j) for i in range(num_firms) for j in range(i + 1, num_firms)]
+        if self.common_random_numbers:
+            model_seed, org_seed, attacker_seed, pair_seed = np.random.SeedSequence(seed).spawn(4)
+            self.rng = self.make_stream(model_seed)
+            org_seeds = org_seed.spawn(num_firms)
+            attacker_rngs = [self.make_stream(s) for s in attacker_seed.spawn(num_attackers_total)]
+            self.pair_rngs = [self.make_stream(s) for s in pair_seed.spawn(len(self.pairs))]
         else:
-            globalVariables.RNG = RandomCallCounter(np.random.default_rng(int(time.time())))
+            self.rng = RandomCallCounter(np.random.default_rng(seed))
+            org_seeds = [None] * num_firms
+            attacker_rngs = [None] * num_attackers_total
+            self.pair_rngs = [self.rng] * len(self.pairs)
+        globalVariables.RNG = self.rng
 
         self.organizations = []
         self.users = []  # keeping track of human users in all networks
@@ -177,33 +272,64 @@ class CybCim(Model):
 
         # determine when attacks will be generated in advance:
         entering_attackers = num_attackers_total - num_attackers_initial
-        self.attack_generation_steps = globalVariables.RNG().choice(np.arange(0, int(self.max_num_steps * 0.75)),
+        self.attack_generation_steps = self.rng().choice(np.arange(0, int(self.max_num_steps * 0.75)),
                                                                     size=entering_attackers, replace=False).tolist()
         self.attack_generation_steps.sort(reverse=True) # first attack to insert is in last place (for easy access and popping)
         # print(self.attack_generation_steps)
         self.num_attackers = num_attackers_total  # adjustable parameter
 
-        self.incident_times = []
+        # security incidents, an incident lasting longer than a security update interval is unhandled
+        incidents = recycled.get("incidents")
+        if incidents is not None and incidents.open.shape == (num_firms, num_attackers_total):
+            incidents.clear()
+            incidents.handled_within = security_update_interval
+            self.incidents = incidents
+        else:
+            self.incidents = IncidentLedger(num_firms, num_attackers_total, security_update_interval)
         self.newly_compromised_per_step = []
         # self.avg_security_per_org = np.zeros(num_subnetworks - 1) # storing averages for data collection # useless
-        self.avg_newly_compromised_per_org = np.zeros(num_firms)  # storing averages for data collection
-
-        # initialize agents
-        self.schedule = SimultaneousActivation(self)
+        # storing averages for data collection
+        self.avg_newly_compromised_per_org = reuse_array(recycled, "avg_newly_compromised_per_org", (num_firms,))
+
+        # initialize agents, organizations are stepped all at once by the scheduler through their shared state
+        state = recycled.get("org_state")
+        if state is not None and state.attacks_compromised_counts.shape == (num_firms, num_attackers_total):
+            state.reset()
+            self.org_state = state
+        else:
+            self.org_state = OrganizationState(self)
+        self.org_state.incidents = self.incidents
+        # pool of the employees' state, each employee holds a row (see Employee), none with the mean-field engine
+        self.employee_compromisers = None
+        if not self.mean_field:
+            self.employee_compromisers = reuse_array(recycled, "employee_compromisers",
+                                                     (num_firms, device_count, num_attackers_total), bool)
+        self.schedule = BatchedOrganizationActivation(self)
         for i in range(0, self.num_firms):  # initialize orgs and add them to user list
-            org = Organization(i, self)
-            self.schedule.add(org)
+            org = Organization(i, self, org_seeds[i])
             self.organizations.append(org)
         for org in self.organizations:
             for user in org.users:
                 self.users.append(user)
                 self.schedule.add(user)
         for i in range(0, self.num_attackers):
-            attacker = Attacker(i, self)
+            attacker = Attacker(i, self, attacker_rngs[i])
             self.attackers.append(attacker)
-            if i < self.active_attacker_count:
+            if i < self.active_attacker_count and not self.mean_field:
                 self.schedule.add(attacker)
 
+        # per organization and attacker probabilities of detecting an attack, rebuilt when the organizations'
+        # security or knowledge changes (targeted table also used for attacks the organization is aware of)
+        self.attacker_effectiveness = np.array([a.effectiveness for a in self.attackers])
+        self.detection_prob_untargeted = reuse_array(recycled, "detection_prob_untargeted",
+                                                     (self.num_firms, self.num_attackers))
+        self.detection_prob_targeted = reuse_array(recycled, "detection_prob_targeted",
+                                                   (self.num_firms, self.num_attackers))
+        self.org_state.update_detection_probabilities(self)
+        if self.mean_field:  # employees and attackers are all stepped by the population
+            self.population = EmployeePopulation(self)
+            self.schedule.add(self.population)
+
         self.total_compromised = 0
         self.org_utility = 0
         self.total_org_utility = 0  # TODO byproduct of the redundant average utility function
@@ -211,77 +337,116 @@ class CybCim(Model):
 
         # TODO possibly move to own function
         # initialize a n*n matrix to store organization closeness disregarding attacker subnetwork
-        self.closeness_matrix = np.full((self.num_firms, self.num_firms), self.initial_closeness, dtype=np.float)
+        self.closeness_matrix = reuse_array(recycled, "closeness_matrix", (self.num_firms, self.num_firms),
+                                            fill=self.initial_closeness)
 
         # initialize a n*n matrix to store organization's trust towards each other disregarding attacker subnetwork
-        self.trust_matrix = np.full((self.num_firms, self.num_firms), self.initial_trust, dtype=np.float)
+        self.trust_matrix = reuse_array(recycled, "trust_matrix", (self.num_firms, self.num_firms),
+                                        fill=self.initial_trust)
 
         # makes the trust factor between an organization and itself zero in order to avoid any average calculation errors
         np.fill_diagonal(self.trust_matrix, 0)
 
-        # data needed for making any graphs
-        self.datacollector = DataCollector(
-            {
-                "Compromised Devices": get_total_compromised,
-                "Closeness": get_avg_closeness,
-                "Average Trust": get_avg_trust,
-                "Free loading": get_free_loading,
-                "total avg sec": get_total_avg_security,
-                "num attackers": get_num_attackers
-            }
-        )
+        # data needed for making any graphs, only created when data is collected (it imports pandas)
+        self.datacollector = recycled.get("datacollector")
+
+        # optional per-step recorder of organization trajectories (see trajectoryStore.py)
+        self.trajectory_recorder = None
+        # optional recorder of the events of the run (see eventLog.py)
+        self.event_log = None
 
         self.running = True
-        self.datacollector.collect(self)
+        if self.collect_data:
+            self.collect()
+
+    def reset(self, seed=None, **params):
+        """
+        Starts a new run of this model, as if it was built again with the current parameters updated with
+        `params` (and `seed` as its global seed, if given). The run is identical to that of a new model, random
+        draws included, but the arrays of the previous run (organizations' state, matrices, the employees' state
+        pool) and its DataCollector are reused in place when their shapes allow it.
+        """
+        params = dict(self.params, **params)
+        if seed is not None:
+            params["global_seed"] = True
+            params["global_seed_value"] = seed
+        recycled = {name: getattr(self, name) for name in RECYCLED_ARRAYS if getattr(self, name) is not None}
+        recycled["org_state"] = self.org_state
+        recycled["incidents"] = self.incidents
+        if self.datacollector is not None and params["async_collection"] == self.async_collection:
+            for values in self.datacollector.model_vars.values():
+                del values[:]
+            self.datacollector._agent_records.clear()
+            recycled["datacollector"] = self.datacollector
+        else:
+            self.close()
+        self._recycled = recycled
+        self.__init__(**params)
+
+    def close(self):
+        """Ends the run: stops the worker of an asynchronous DataCollector (its data stays readable)."""
+        if self.datacollector is not None and hasattr(self.datacollector, "close"):
+            self.datacollector.close()
+
+    @staticmethod
+    def make_stream(seed_sequence):
+        return RandomCallCounter(np.random.default_rng(seed_sequence))
 
     def information_sharing_game(self):
         # TODO: implement trust factor
-        for i in range(self.num_firms):
-            for j in range(i + 1, self.num_firms): # only visit top matrix triangle
-                r = globalVariables.RNG().random()
-                if self.closeness_matrix[i, j] > r:  # will interact event
-                    t1 = self.trust_matrix[i, j]
-                    t2 = self.trust_matrix[j, i]
-                    closeness = self.closeness_matrix[i][j]
-                    # get each organization's decision to share or not based on its trust towards the other
-                    r1 = self.organizations[i].share_decision(self.organizations[j], t1)
-                    r2 = self.organizations[j].share_decision(self.organizations[i], t2)
-                    choice = [r1, r2]
-                    if sum(choice) == 2:  # both cooperate/share
-                        # come closer to each other for both orgs (symmetric matrix)
-                        self.closeness_matrix[i, j] = get_reciprocity(sum(choice), closeness, self.reciprocity)
-                        self.closeness_matrix[j, i] = get_reciprocity(sum(choice), closeness, self.reciprocity)
-
-                        # trust will increase for both organizations
-                        self.trust_matrix[i, j] = increase_trust(t1, self.trust_factor)
-                        self.trust_matrix[j, i] = increase_trust(t2, self.trust_factor)
-
-
-                        # actually gain information for both organizations
-                        share_info_cooperative(self.organizations[i], self.organizations[j])
-                        share_info_cooperative(self.organizations[j], self.organizations[i])
-
-                    elif sum(choice) == 0:  # both defect
-                        # grow further away from each other for both orgs (symmetric matrix)
-                        self.closeness_matrix[i, j] = get_reciprocity(sum(choice), closeness, self.reciprocity)
-                        self.closeness_matrix[j, i] = get_reciprocity(sum(choice), closeness, self.reciprocity)
-
-                        # trust will not be affected in this case
-
-                    # one defects and one cooperates #no change in closeness #TODO implement different behaviour?
-                    elif sum(choice) == 1:
-                        if choice[0] == 1: # only org i shares
-                            share_info_selfish(self.organizations[i], self.organizations[j])
-                            self.trust_matrix[i, j] = decrease_trust(t1, self.trust_factor) # org i will trust org j less
-                            # org j will nto update its trust
-
-                        else: # org j shares
-                            share_info_selfish(self.organizations[j], self.organizations[i])
-                            self.trust_matrix[j, i] = decrease_trust(t2, self.trust_factor) # org j will trust org i less
-                            #org i will not update its trust
-                else:
-                    globalVariables.RNG().random()  # dummy, for consistent randomness when branching
-                    globalVariables.RNG().random()  # dummy, for consistent randomness when branching
+        for pair, (i, j) in enumerate(self.pairs):  # only visit top matrix triangle
+            rng = self.pair_rngs[pair]
+            r = rng().random()
+            if self.closeness_matrix[i, j] > r:  # will interact event
+                t1 = self.trust_matrix[i, j]
+                t2 = self.trust_matrix[j, i]
+                closeness = self.closeness_matrix[i][j]
+                # get each organization's decision to share or not based on its trust towards the other
+                r1 = self.organizations[i].share_decision(self.organizations[j], t1, rng)
+                r2 = self.organizations[j].share_decision(self.organizations[i], t2, rng)
+                choice = [r1, r2]
+                if sum(choice) == 2:  # both cooperate/share
+                    # come closer to each other for both orgs (symmetric matrix)
+                    self.closeness_matrix[i, j] = get_reciprocity(sum(choice), closeness, self.reciprocity)
+                    self.closeness_matrix[j, i] = get_reciprocity(sum(choice), closeness, self.reciprocity)
+
+                    # trust will increase for both organizations
+                    self.trust_matrix[i, j] = increase_trust(t1, self.trust_factor)
+                    self.trust_matrix[j, i] = increase_trust(t2, self.trust_factor)
+
+
+                    # actually gain information for both organizations
+                    share_info_cooperative(self.organizations[i], self.organizations[j])
+                    share_info_cooperative(self.organizations[j], self.organizations[i])
+
+                elif sum(choice) == 0:  # both defect
+                    # grow further away from each other for both orgs (symmetric matrix)
+                    self.closeness_matrix[i, j] = get_reciprocity(sum(choice), closeness, self.reciprocity)
+                    self.closeness_matrix[j, i] = get_reciprocity(sum(choice), closeness, self.reciprocity)
+
+                    # trust will not be affected in this case
+
+                # one defects and one cooperates #no change in closeness #TODO implement different behaviour?
+                elif sum(choice) == 1:
+                    if choice[0] == 1: # only org i shares
+                        share_info_selfish(self.organizations[i], self.organizations[j])
+                        self.trust_matrix[i, j] = decrease_trust(t1, self.trust_factor) # org i will trust org j less
+                        # org j will nto update its trust
+
+                    else: # org j shares
+                        share_info_selfish(self.organizations[j], self.organizations[i])
+                        self.trust_matrix[j, i] = decrease_trust(t2, self.trust_factor) # org j will trust org i less
+                        #org i will not update its trust
+                if self.event_log is not None:
+                    self.log_pair(i, j)
+            else:
+                rng.skip(2)  # skip the two decisions, for consistent randomness when branching
+
+    def log_pair(self, i, j):
+        """Records the closeness and trust of a pair of organizations in the event log."""
+        for a, b in ((i, j), (j, i)):
+            self.event_log.record(CLOSENESS, a, b, value=self.closeness_matrix[a, b])
+            self.event_log.record(TRUST, a, b, value=self.trust_matrix[a, b])
 
     # given two organiziation indices, return their closeness
     def get_closeness(self, i, j):
@@ -298,25 +463,80 @@ class CybCim(Model):
     def step(self):
         if self.information_sharing:
             self.information_sharing_game()  # TODO: move after agent step???
-        else:
-            self.dummy_fun_1()  # for consistent randomness during branching
+        elif not self.common_random_numbers:
+            # skip the draws of the sharing game, for consistent randomness during branching
+            self.rng.skip(3 * len(self.pairs))
 
         current_step = self.schedule.steps
         if self.attack_generation_steps and current_step >= self.attack_generation_steps[-1]:
             self.attack_generation_steps.pop()
-            self.schedule.add(self.attackers[self.active_attacker_count])
+            if not self.mean_field:
+                self.schedule.add(self.attackers[self.active_attacker_count])
+            if self.event_log is not None:
+                self.event_log.record(ARRIVAL, attacker=self.active_attacker_count)
             self.active_attacker_count += 1
 
         # update agents
         self.schedule.step()
+        if self.collect_data:
+            self.collect()
+        if self.trajectory_recorder is not None:
+            self.trajectory_recorder.record(self)
+        # print(self.rng.call_count)
+        self.rng.call_count = 0
+
+    def collect(self):
+        if self.datacollector is None:
+            reporters = {
+                "Compromised Devices": get_total_compromised,
+                "Closeness": get_avg_closeness,
+                "Average Trust": get_avg_trust,
+                "Free loading": get_free_loading,
+                "total avg sec": get_total_avg_security,
+                "num attackers": get_num_attackers
+            }
+            if self.async_collection:
+                from asyncCollection import AsyncDataCollector
+                self.datacollector = AsyncDataCollector(reporters, use_process=self.async_collection == "process")
+            else:
+                from mesa.datacollection import DataCollector
+                self.datacollector = DataCollector(reporters)
         self.datacollector.collect(self)
-        # print(globalVariables.RNG.call_count)
-        globalVariables.RNG.call_count = 0
 
-    def dummy_fun_1(self):
-        for i in range(self.num_firms):
-            for j in range(i + 1, self.num_firms):
-                globalVariables.RNG().random()
-                globalVariables.RNG().random()
-                globalVariables.RNG().random()
+    def iter_steps(self, n, fields=None, as_array=False, sink=None):
+        """
+        Runs the model for (at most) `n` steps, yielding the requested metrics after every step without keeping
+        any history: the DataCollector is paused while iterating.
+        :param fields: names of STEP_FIELDS to report (all of them if None). "step" is always reported first.
+        :param as_array: yield a NumPy array [step, field values...] instead of a namedtuple. The same array is
+                         updated in place at every step, copy it to keep it. Only for fields with scalar values.
+        :param sink: optional object with a `write(record)` method receiving every record as a dictionary,
+                     such as metricSinks.JsonLinesSink or metricSinks.SocketSink
+        """
+        if fields is None:
+            fields = list(STEP_FIELDS.keys())
+        fields = ["step"] + [f for f in fields if f != "step"]
+        reporters = [STEP_FIELDS[f] for f in fields]
+        record_type = namedtuple("StepRecord", fields)
+        values = np.empty(len(fields)) if as_array else None
+
+        collect_data = self.collect_data
+        self.collect_data = False
+        try:
+            for _ in range(n):
+                if not self.running:
+                    break
+                self.step()
+                record = [reporter(self) for reporter in reporters]
+                if sink is not None:
+                    sink.write(dict(zip(fields, record)))
+                if as_array:
+                    values[:] = record
+                    yield values
+                else:
+                    yield record_type(*record)
+        finally:
+            self.collect_data = collect_data
+
 
+CybCim.PARAMETERS = [name for name in inspect.signature(CybCim.__init__).parameters if name != "self"]
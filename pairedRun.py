@@ -0,0 +1,69 @@
+"""
+Paired runs of CybCim with and without information sharing.
+
+The two variants of a pair are built separately from the same seed, so they have the same setup (organization
+permutations, attack generation steps, employees, attackers and their effectiveness): building does not depend on
+sharing, and a model without sharing skips the draws of the sharing game, so each variant is identical to a run
+built on its own with the same seed. The setup is built twice: copying a built model (or resetting one) costs
+more than building it. Running both in lockstep gives the per-step paired differences directly, the variants
+using the same random numbers everywhere but in the sharing game.
+"""
+import time
+from collections import namedtuple
+import numpy as np
+
+from model import CybCim, STEP_FIELDS
+
+
+def make_pair(model_cls=CybCim, **params):
+    """
+    Builds the two variants of a pair from the same seed (a time based one, as CybCim's, if not seeded).
+    :return: (model with sharing, model without sharing)
+    """
+    params = dict(params)
+    if not params.get("global_seed", True):
+        params["global_seed"] = True
+        params["global_seed_value"] = int(time.time())
+    sharing = model_cls(**dict(params, information_sharing=True))
+    no_sharing = model_cls(**dict(params, information_sharing=False))
+    return sharing, no_sharing
+
+
+def iter_paired_steps(sharing, no_sharing, n, fields=None, sink=None):
+    """
+    Runs both variants of a pair in lockstep for (at most) `n` steps, yielding after every step
+    (record with sharing, record without sharing, difference), where the difference is with sharing minus
+    without sharing ("step" excepted).
+    :param fields: names of STEP_FIELDS to report (all of them if None). "step" is always reported first.
+    :param sink: optional object with a `write(record)` method receiving every step as a dictionary
+                 {"step", "sharing", "no_sharing", "difference"}, see metricSinks.py
+    """
+    if fields is None:
+        fields = list(STEP_FIELDS.keys())
+    fields = ["step"] + [f for f in fields if f != "step"]
+    reporters = [STEP_FIELDS[f] for f in fields]
+    record_type = namedtuple("StepRecord", fields)
+
+    for _ in range(n):
+        if not (sharing.running and no_sharing.running):
+            break
+        sharing.step()
+        no_sharing.step()
+        a = record_type(*[reporter(sharing) for reporter in reporters])
+        b = record_type(*[reporter(no_sharing) for reporter in reporters])
+        difference = record_type(a.step, *[x - y for x, y in zip(a[1:], b[1:])])
+        if sink is not None:
+            sink.write({"step": a.step, "sharing": a._asdict(), "no_sharing": b._asdict(),
+                        "difference": difference._asdict()})
+        yield a, b, difference
+
+
+def run_pair(sharing, no_sharing, max_steps, fields=None):
+    """
+    Runs both variants of a pair to `max_steps` steps.
+    :return: array of the per-step differences, one row per step and one column per field ("step" first)
+    """
+    differences = [difference for _, _, difference in
+                   iter_paired_steps(sharing, no_sharing, max_steps - sharing.schedule.steps, fields)]
+    num_fields = len(differences[0]) if differences else 1
+    return np.array(differences, dtype=float).reshape(-1, num_fields)
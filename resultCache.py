@@ -0,0 +1,191 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+# source files whose content determines the outcome of a run; any change to them invalidates the cache
+MODEL_SOURCES = ["model.py", "helpers.py", "globalVariables.py", "agents/agents.py", "agents/subnetworks.py",
+                 "agents/population.py", "incidentLedger.py", "eventLog.py"]
+
+_code_version = None
+
+
+def code_version():
+    """Returns a hash of the model source files, computed once per process."""
+    global _code_version
+    if _code_version is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256()
+        for source in MODEL_SOURCES:
+            h.update(source.encode())
+            with open(os.path.join(root, source), "rb") as f:
+                h.update(f.read())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+def model_parameters(model_cls, kwargs):
+    """Returns the full set of parameters a model is built with: the constructor defaults updated with `kwargs`."""
+    params = {}
+    for name, p in inspect.signature(model_cls.__init__).parameters.items():
+        if name != "self" and p.default is not inspect.Parameter.empty:
+            params[name] = p.default
+    params.update(kwargs)
+    return params
+
+
+def relevant_parameters(model_cls, params):
+    """
+    Returns a copy of the full parameter set `params` in which the parameters that can't affect the run, according
+    to the model's PARAMETER_DEPENDENCIES, are set to their default. Seeded runs with the same relevant parameters
+    are identical.
+    """
+    dependencies = getattr(model_cls, "PARAMETER_DEPENDENCIES", {})
+    defaults = model_parameters(model_cls, {})
+    relevant = dict(params)
+    for name, conditions in dependencies.items():
+        if name in relevant and any(params.get(other) not in values for other, values in conditions.items()):
+            relevant[name] = defaults[name]
+    return relevant
+
+
+def _reporter_name(reporter):
+    # model reporters are functions, agent reporters are attribute names
+    if isinstance(reporter, str):
+        return reporter
+    name = getattr(reporter, "__qualname__", reporter.__name__)
+    if "<" in name:  # "<lambda>", "f.<locals>.g": the name doesn't identify the function
+        raise ValueError("model reporter %s.%s can't be cached, use a module level function"
+                         % (reporter.__module__, name))
+    return "%s.%s" % (reporter.__module__, name)
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of the reporter values of completed runs.
+
+    A run is identified by a hash of its full parameter set (seed included), its number of steps and the
+    version of the model code, so identical seeded runs are only ever simulated once. Reporter values are
+    stored per reporter function / agent attribute, so adding a reporter to a sweep only re-runs the models
+    for the missing values and merges them into the existing entries.
+
+    Model reporters are identified by their module and qualified name, so they must be module level functions
+    (or methods): lambdas and nested functions are rejected with a ValueError.
+
+    The cache is bounded by `max_bytes` and/or `max_entries`; least recently used entries are evicted first.
+    """
+
+    def __init__(self, path, max_bytes=None, max_entries=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, model_cls, kwargs, max_steps):
+        """
+        Returns the cache key of a run, or None if the run is not deterministic (no global seed) and can't be cached.
+        """
+        params = model_parameters(model_cls, kwargs)
+        if not params.get("global_seed", False):
+            return None
+        params = relevant_parameters(model_cls, params)  # equivalent runs share their entry
+        description = {
+            "model": "%s.%s" % (model_cls.__module__, model_cls.__name__),
+            "params": {name: repr(value) for name, value in params.items()},
+            "max_steps": max_steps,
+            "code": code_version(),
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key, model_reporters=None, agent_reporters=None):
+        """
+        Returns (model_vars, agent_vars) for the given reporters, labelled like the reporter dictionaries,
+        or None if the run or any of the reporters is missing from the cache.
+        """
+        names = {label: _reporter_name(reporter) for label, reporter in (model_reporters or {}).items()}
+        entry = self._read(key)
+        if entry is None:
+            return None
+
+        model_vars = {}
+        for label, name in names.items():
+            if name not in entry["model_vars"]:
+                return None
+            model_vars[label] = entry["model_vars"][name]
+
+        agent_vars = {}
+        for agent_id, record in entry["agent_vars"].items():
+            agent_vars[agent_id] = {}
+            for label, reporter in (agent_reporters or {}).items():
+                if reporter not in record:
+                    return None
+                agent_vars[agent_id][label] = record[reporter]
+        if agent_reporters and not agent_vars:
+            return None
+
+        os.utime(self._entry_path(key))  # mark as recently used
+        return model_vars, agent_vars
+
+    def put(self, key, model_vars, agent_vars, model_reporters=None, agent_reporters=None):
+        """
+        Stores the reporter values of a run, merging them with the values already cached for it.
+        :param model_vars: model reporter values labelled like `model_reporters`
+        :param agent_vars: agent id -> agent reporter values labelled like `agent_reporters`
+        """
+        entry = self._read(key) or {"model_vars": {}, "agent_vars": {}}
+        for label, reporter in (model_reporters or {}).items():
+            entry["model_vars"][_reporter_name(reporter)] = model_vars[label]
+        for agent_id, record in agent_vars.items():
+            cached_record = entry["agent_vars"].setdefault(agent_id, {})
+            for label, reporter in (agent_reporters or {}).items():
+                cached_record[reporter] = record[label]
+
+        # write to a temporary file first, several workers may share the cache
+        path = self._entry_path(key)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache is within its size limits."""
+        if self.max_bytes is None and self.max_entries is None:
+            return
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:  # evicted by another worker
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and ((self.max_bytes is not None and total_bytes > self.max_bytes) or
+                           (self.max_entries is not None and len(entries) > self.max_entries)):
+            _, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def size(self):
+        """Returns the number of cached runs and their total size in bytes."""
+        sizes = [os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path)
+                 if name.endswith(".pkl")]
+        return len(sizes), sum(sizes)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + ".pkl")
+
+    def _read(self, key):
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
@@ -4,6 +4,7 @@ from mesa.visualization.modules import ChartModule
 from visualization.visualization import *
 from mesa.visualization.ModularVisualization import VisualizationElement
 from model import CybCim
+import os
 
 model_params = {
     'verbose': UserSettableParameter(param_type='checkbox', name='Verbose', value=False,
@@ -65,5 +66,12 @@ card_view = OrganizationCardModule()
 # required in order to load visualization/modular_template.html
 ModularServer.settings["template_path"] = 'visualization/'
 
-server = ModularServer(CybCim, [card_view, composite_view], 'Computer Network', model_params)
+elements = [card_view, composite_view]
+# predictions of an emulator fitted on sweep results, shown when one was saved (see surrogate.py)
+SURROGATE_PATH = "surrogate.pkl"
+if os.path.exists(SURROGATE_PATH):
+    from surrogate import Surrogate
+    elements.append(SurrogatePredictionElement(Surrogate.load(SURROGATE_PATH)))
+
+server = ModularServer(CybCim, elements, 'Computer Network', model_params)
 server.verbose = False
@@ -0,0 +1,308 @@
+"""
+Multi-session visualization server.
+
+Every browser session (websocket connection) gets its own model, owned by a worker: a thread of this process or
+a separate worker process (`use_processes`). The tornado event loop only relays messages and waits for the
+workers asynchronously, so a heavy session doesn't stall the others. The number of concurrent sessions is
+limited, and sessions idle for longer than `idle_timeout` seconds are closed and their models released.
+
+    python sessionServer.py --processes --workers 4 --max-sessions 8 --idle-timeout 600
+"""
+import argparse
+import copy
+import itertools
+import multiprocessing
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.escape
+import tornado.ioloop
+import tornado.locks
+import tornado.web
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
+from mesa.visualization.UserParam import UserSettableParameter
+
+# models read and write module-level globals (globalVariables) while they are built, so sessions of a same process
+# are never built concurrently
+_build_lock = threading.Lock()
+
+
+def _close(model):
+    """Ends the run of a session's model (see CybCim.close)."""
+    if hasattr(model, "close"):
+        model.close()
+
+
+def _execute(models, model_cls, elements, command, session_id, params):
+    """
+    Executes a session command against the models of a worker.
+    :return: (status, data): ("ok", rendered state), ("end", None) when the model stopped running, ("closed", None)
+             or ("error", traceback)
+    """
+    try:
+        if command in ("close", "reset") and session_id in models:
+            _close(models.pop(session_id))
+        if command == "close":
+            return "closed", None
+        if command == "reset":
+            with _build_lock:
+                models[session_id] = model_cls(**params)
+        elif command == "step":
+            model = models[session_id]
+            if not model.running:
+                return "end", None
+            model.step()
+        return "ok", [element.render(models[session_id]) for element in elements]
+    except Exception:
+        return "error", traceback.format_exc()
+
+
+def _serve(conn, model_cls, elements):
+    """Main loop of a worker process: executes the commands received on `conn` until it is closed."""
+    models = {}
+    while True:
+        try:
+            command, session_id, params = conn.recv()
+        except (EOFError, OSError):
+            break
+        if command == "stop":
+            break
+        conn.send(_execute(models, model_cls, elements, command, session_id, params))
+
+
+class ThreadWorker:
+    """Worker holding its sessions' models in this process, commands run in the server's thread pool."""
+
+    def __init__(self, model_cls, elements):
+        self.model_cls = model_cls
+        self.elements = elements
+        self.models = {}
+        self.sessions = 0
+
+    def call(self, command, session_id, params=None):
+        return _execute(self.models, self.model_cls, self.elements, command, session_id, params)
+
+    def stop(self):
+        for model in self.models.values():
+            _close(model)
+        self.models.clear()
+
+
+class ProcessWorker:
+    """Worker holding its sessions' models in a separate process, one command at a time."""
+
+    def __init__(self, model_cls, elements):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child_conn, model_cls, elements), daemon=True)
+        self.process.start()
+        self.lock = threading.Lock()
+        self.sessions = 0
+
+    def call(self, command, session_id, params=None):
+        with self.lock:
+            self.conn.send((command, session_id, params))
+            return self.conn.recv()
+
+    def stop(self):
+        with self.lock:
+            self.conn.send(("stop", None, None))
+        self.process.join(5)
+
+
+class Session:
+    def __init__(self, session_id, handler, worker, params):
+        self.id = session_id
+        self.handler = handler
+        self.worker = worker
+        self.params = params  # this session's values of the model parameters
+        self.last_active = time.time()
+        self.lock = tornado.locks.Lock()  # commands of a session are executed in order
+        self.step_requested = False  # a get_step arrived since the stepping task last started a step
+        self.stepping = False  # whether the stepping task is running
+
+
+class SessionSocketHandler(SocketHandler):
+    """Websocket handler relaying the messages of one browser session to its worker."""
+
+    def open(self):
+        self.session = self.application.open_session(self)
+        if self.session is None:
+            self.close(1013, "Too many sessions, try again later")
+
+    def on_close(self):
+        if getattr(self, "session", None) is not None:
+            self.application.close_session(self.session)
+            self.session = None
+
+    async def on_message(self, message):
+        session = getattr(self, "session", None)
+        if session is None:
+            return
+        session.last_active = time.time()
+        msg = tornado.escape.json_decode(message)
+
+        if msg["type"] == "get_step":
+            # steps are run by a task of the session, so that the messages keep being read while a step runs:
+            # the steps requested meanwhile are coalesced into a single one
+            session.step_requested = True
+            if not session.stepping:
+                session.stepping = True
+                tornado.ioloop.IOLoop.current().spawn_callback(self.run_steps, session)
+
+        elif msg["type"] == "reset":
+            session.step_requested = False  # steps requested before the reset are dropped
+            await self.run_command(session, "reset", dict(session.params))
+
+        elif msg["type"] == "submit_params":
+            if msg["param"] in self.application.user_params:
+                session.params[msg["param"]] = msg["value"]
+
+        elif msg["type"] == "get_params":
+            self.write_message({"type": "model_params", "params": self.application.session_user_params(session)})
+
+        elif self.application.verbose:
+            print("Unexpected message!")
+
+    async def run_steps(self, session):
+        """Runs a step as long as one was requested since the previous step started."""
+        try:
+            while session.step_requested and self.ws_connection is not None:
+                session.step_requested = False
+                await self.run_command(session, "step")
+        finally:
+            session.stepping = False
+
+    async def run_command(self, session, command, params=None):
+        async with session.lock:
+            status, data = await self.application.call(session, command, params)
+        if self.ws_connection is None:  # closed in the meantime
+            return
+        if status == "ok":
+            self.write_message({"type": "viz_state", "data": data})
+        elif status == "end":
+            self.write_message({"type": "end"})
+        elif status == "error":
+            print("Session %d failed:\n%s" % (session.id, data))
+            self.close(1011, "Model error")
+
+
+class SessionServer(ModularServer):
+    """
+    ModularServer running one model per browser session in a pool of workers.
+    :param workers: number of worker threads (or processes)
+    :param use_processes: run the models in worker processes instead of threads of the server process
+    :param max_sessions: maximum number of concurrent sessions, further connections are refused
+    :param idle_timeout: seconds without messages after which a session is closed
+    """
+
+    socket_handler = (r'/ws', SessionSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler,
+                ModularServer.local_handler]
+
+    def __init__(self, model_cls, visualization_elements, name="Mesa Model", model_params={}, workers=4,
+                 use_processes=False, max_sessions=8, idle_timeout=600):
+        super().__init__(model_cls, visualization_elements, name, model_params)
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        worker_cls = ProcessWorker if use_processes else ThreadWorker
+        self.workers = [worker_cls(model_cls, visualization_elements) for _ in range(workers)]
+        # threads waiting for the workers (or running the models of thread workers)
+        self.executor = ThreadPoolExecutor(max(workers, max_sessions))
+        self.sessions = {}
+        self.session_ids = itertools.count()
+        self.eviction = None
+
+    def reset_model(self):
+        # models are only built by the sessions
+        self.model = None
+
+    def session_params(self):
+        """Returns the current values of the model parameters, the starting point of a new session."""
+        params = {}
+        for key, val in self.model_kwargs.items():
+            if isinstance(val, UserSettableParameter):
+                if val.param_type == 'static_text':  # static_text is never used for setting params
+                    continue
+                params[key] = val.value
+            else:
+                params[key] = val
+        return params
+
+    def session_user_params(self, session):
+        """Returns the user settable parameters, with the values of `session`."""
+        result = {}
+        for param, val in self.model_kwargs.items():
+            if isinstance(val, UserSettableParameter):
+                result[param] = copy.copy(val.json)
+                if param in session.params:
+                    result[param]["value"] = session.params[param]
+        return result
+
+    def open_session(self, handler):
+        """Returns a new session for the websocket `handler`, or None if the server is full."""
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        worker = min(self.workers, key=lambda w: w.sessions)  # least loaded worker
+        worker.sessions += 1
+        session = Session(next(self.session_ids), handler, worker, self.session_params())
+        self.sessions[session.id] = session
+        if self.verbose:
+            print("Session %d opened (%d sessions)" % (session.id, len(self.sessions)))
+        return session
+
+    def close_session(self, session):
+        if self.sessions.pop(session.id, None) is None:
+            return
+        session.worker.sessions -= 1
+        self.executor.submit(session.worker.call, "close", session.id)
+        if self.verbose:
+            print("Session %d closed (%d sessions)" % (session.id, len(self.sessions)))
+
+    def call(self, session, command, params=None):
+        """Runs a command of `session` on its worker without blocking the event loop."""
+        return tornado.ioloop.IOLoop.current().run_in_executor(self.executor, session.worker.call, command,
+                                                               session.id, params)
+
+    def evict_idle_sessions(self):
+        now = time.time()
+        for session in list(self.sessions.values()):
+            if now - session.last_active > self.idle_timeout:
+                session.handler.close(1001, "Session idle for too long")
+                self.close_session(session)
+
+    def launch(self, port=None):
+        """ Run the app, evicting idle sessions every few seconds. """
+        self.eviction = tornado.ioloop.PeriodicCallback(self.evict_idle_sessions,
+                                                        min(self.idle_timeout, 10) * 1000)
+        self.eviction.start()
+        try:
+            super().launch(port)
+        finally:
+            self.eviction.stop()
+            for worker in self.workers:
+                worker.stop()
+            self.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-session CybCim visualization server")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=4, help="number of worker threads or processes")
+    parser.add_argument("--processes", action="store_true", help="run the models in worker processes")
+    parser.add_argument("--max-sessions", type=int, default=8)
+    parser.add_argument("--idle-timeout", type=float, default=600, help="seconds before an idle session is closed")
+    args = parser.parse_args()
+
+    from model import CybCim
+    from server import model_params, elements
+    session_server = SessionServer(CybCim, elements, 'Computer Network', model_params,
+                                   workers=args.workers, use_processes=args.processes,
+                                   max_sessions=args.max_sessions, idle_timeout=args.idle_timeout)
+    session_server.verbose = False
+    session_server.launch(args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Surrogate emulator of CybCim: instant what-if predictions of the outcome of a run from stored sweep results.
+
+A Gaussian process per reporter (STEP_FIELDS name, value at the end of a run) is fitted on the parameter points
+of past runs, such as the model dataframe of a batch run. Predictions come with their standard deviation and
+take milliseconds. `query` only runs real simulations where the emulator is too uncertain, adds them to the
+training data and refits, so the emulator improves where it is used.
+
+    python surrogate.py fit results.csv surrogate.pkl --column compromised="Compromised Devices"
+    python surrogate.py query surrogate.pkl --param reciprocity=3 --param trust_factor=1.5
+"""
+import argparse
+import pickle
+import numpy as np
+
+from headless import parse_parameters
+from model import CybCim
+from resultCache import model_parameters
+
+# parameters the emulator is a function of, with the ranges of the visualization sliders (inputs are scaled to
+# [0, 1] over these ranges)
+PARAMETER_RANGES = {
+    "information_sharing": (0, 1),
+    "reciprocity": (1, 5),
+    "trust_factor": (1, 5),
+    "initial_trust": (0, 1),
+    "initial_closeness": (0, 1),
+    "security_update_interval": (1, 50),
+    "acceptable_freeload": (0, 1),
+}
+
+FIELDS = ["compromised", "closeness", "trust", "security", "free_loading"]
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression with a squared exponential kernel (one length scale per input) and Gaussian
+    noise. The hyperparameters maximize the log marginal likelihood, found by a coordinate search in log space.
+    """
+
+    def __init__(self):
+        self.log_params = None  # log length scales..., log signal variance, log noise variance
+
+    def _kernel(self, a, b, log_params):
+        scales = np.exp(log_params[:-2])
+        d = (a[:, None, :] - b[None, :, :]) / scales
+        return np.exp(log_params[-2]) * np.exp(-0.5 * (d * d).sum(axis=2))
+
+    def _log_likelihood(self, log_params):
+        k = self._kernel(self.x, self.x, log_params) + (np.exp(log_params[-1]) + 1e-8) * np.eye(len(self.x))
+        try:
+            chol = np.linalg.cholesky(k)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, self.y))
+        return -0.5 * self.y.dot(alpha) - np.log(np.diag(chol)).sum()
+
+    def fit(self, x, y, iterations=40):
+        self.x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.y_mean = y.mean()
+        self.y_scale = y.std() or 1.0
+        self.y = (y - self.y_mean) / self.y_scale
+
+        log_params = self.log_params
+        if log_params is None or len(log_params) != self.x.shape[1] + 2:
+            log_params = np.log(np.r_[np.full(self.x.shape[1], 0.5), 1.0, 0.1])
+        best = self._log_likelihood(log_params)
+        step = 1.0
+        for _ in range(iterations):
+            improved = False
+            for i in range(len(log_params)):
+                for direction in (step, -step):
+                    candidate = log_params.copy()
+                    candidate[i] = np.clip(candidate[i] + direction, -7, 5)
+                    value = self._log_likelihood(candidate)
+                    if value > best:
+                        best, log_params, improved = value, candidate, True
+                        break
+            if not improved:
+                step /= 2
+                if step < 0.05:
+                    break
+        self.log_params = log_params
+
+        k = self._kernel(self.x, self.x, log_params) + (np.exp(log_params[-1]) + 1e-8) * np.eye(len(self.x))
+        self.chol = np.linalg.cholesky(k)
+        self.alpha = np.linalg.solve(self.chol.T, np.linalg.solve(self.chol, self.y))
+        return self
+
+    def predict(self, x):
+        """Returns the predicted mean and standard deviation of the (noiseless) output at the points `x`."""
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        k = self._kernel(x, self.x, self.log_params)
+        mean = k.dot(self.alpha)
+        v = np.linalg.solve(self.chol, k.T)
+        variance = np.maximum(np.exp(self.log_params[-2]) - (v * v).sum(axis=0), 0)
+        return mean * self.y_scale + self.y_mean, np.sqrt(variance) * self.y_scale
+
+
+class Surrogate:
+    """
+    Emulator of the values of reporters at the end of a run, as functions of PARAMETER_RANGES parameters.
+    :param fixed_parameters: the other parameters of the runs (of the training data and of the simulations)
+    :param steps: number of steps of a run
+    :param uncertainty_threshold: `query` simulates when a prediction's standard deviation exceeds this fraction
+                                  of the reporter's range in the training data
+    :param runs_per_query: number of seeds simulated by an uncertain query
+    """
+
+    def __init__(self, fixed_parameters=None, steps=1000, fields=None, uncertainty_threshold=0.1,
+                 runs_per_query=2):
+        self.fixed_parameters = dict(fixed_parameters or {})
+        self.steps = steps
+        self.fields = list(fields or FIELDS)
+        self.uncertainty_threshold = uncertainty_threshold
+        self.runs_per_query = runs_per_query
+        self.x = []
+        self.y = {field: [] for field in self.fields}
+        self.processes = {}
+        self.next_seed = 100000  # seed of the next simulation run by a query
+
+    def encode(self, params):
+        """Scales the emulated parameters of `params` to [0, 1] (defaults of CybCim for missing ones)."""
+        full = model_parameters(CybCim, dict(self.fixed_parameters, **params))
+        return [(float(full[name]) - low) / (high - low) for name, (low, high) in PARAMETER_RANGES.items()]
+
+    def add(self, params, values):
+        """Adds the result of a run: its parameters and the values of the fields (field -> value)."""
+        self.x.append(self.encode(params))
+        for field in self.fields:
+            self.y[field].append(float(values[field]))
+
+    def add_dataframe(self, df, columns=None):
+        """
+        Adds the runs of a batch run's model dataframe.
+        :param columns: field -> column of the dataframe (the field name itself if missing)
+        """
+        columns = dict(columns or {})
+        parameters = [name for name in df.columns if name in PARAMETER_RANGES]
+        for _, row in df.iterrows():
+            self.add({name: row[name] for name in parameters},
+                     {field: row[columns.get(field, field)] for field in self.fields})
+
+    def fit(self):
+        for field in self.fields:
+            process = self.processes.get(field, GaussianProcess())
+            self.processes[field] = process.fit(self.x, self.y[field])
+        return self
+
+    def predict(self, params):
+        """Returns field -> (mean, standard deviation) of the value at the end of a run with `params`."""
+        x = [self.encode(params)]
+        predictions = {}
+        for field in self.fields:
+            mean, std = self.processes[field].predict(x)
+            predictions[field] = (float(mean[0]), float(std[0]))
+        return predictions
+
+    def is_uncertain(self, predictions):
+        for field, (_, std) in predictions.items():
+            values = self.y[field]
+            spread = max(values) - min(values) if values else 0
+            if std > self.uncertainty_threshold * (spread or 1):
+                return True
+        return False
+
+    def simulate(self, params):
+        """Runs `runs_per_query` real simulations of `params`, adds them and refits."""
+        import headless
+        for _ in range(self.runs_per_query):
+            run_params = dict(self.fixed_parameters, **params)
+            run_params.update(global_seed=True, global_seed_value=self.next_seed, max_num_steps=self.steps)
+            self.next_seed += 1
+            record = headless.run(self.steps, fields=self.fields, **run_params)
+            self.add(params, record._asdict())
+        self.fit()
+
+    def query(self, params):
+        """
+        Returns (predictions, simulated): the predictions for `params`, after simulating it first when the
+        emulator is too uncertain there.
+        """
+        predictions = self.predict(params)
+        if not self.is_uncertain(predictions):
+            return predictions, False
+        self.simulate(params)
+        return self.predict(params), True
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Surrogate emulator of CybCim runs")
+    subparsers = parser.add_subparsers(dest="command")
+    fit_parser = subparsers.add_parser("fit", help="fit an emulator on a batch run's model dataframe (csv)")
+    fit_parser.add_argument("results")
+    fit_parser.add_argument("path", help="where to save the emulator")
+    fit_parser.add_argument("--steps", type=int, default=1000, help="number of steps of the runs")
+    fit_parser.add_argument("--column", action="append",
+                            help="column of the results holding a field, as field=column")
+    fit_parser.add_argument("--param", action="append", help="fixed model parameter of the runs, as name=value")
+    query_parser = subparsers.add_parser("query", help="predict the outcome of a run")
+    query_parser.add_argument("path")
+    query_parser.add_argument("--param", action="append", help="model parameter, as name=value")
+    query_parser.add_argument("--no-simulate", action="store_true", help="never run simulations")
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        import pandas as pd
+        columns = dict(column.split("=", 1) for column in args.column or [])
+        df = pd.read_csv(args.results)
+        surrogate = Surrogate(parse_parameters(args.param), args.steps, fields=list(columns) or None)
+        surrogate.add_dataframe(df, columns)
+        surrogate.fit().save(args.path)
+        print("Fitted on %d runs" % len(surrogate.x))
+    elif args.command == "query":
+        surrogate = Surrogate.load(args.path)
+        params = parse_parameters(args.param)
+        if args.no_simulate:
+            predictions, simulated = surrogate.predict(params), False
+        else:
+            predictions, simulated = surrogate.query(params)
+            if simulated:
+                surrogate.save(args.path)
+        for field, (mean, std) in predictions.items():
+            print("%-14s %12.4f +- %.4f" % (field, mean, std))
+        if simulated:
+            print("(uncertain: %d simulations added)" % surrogate.runs_per_query)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+from batchRunner import AdaptiveBatchRunner
+from model import CybCim, get_total_compromised
+
+
+def test_adaptive_run_ids_are_unique():
+    runner = AdaptiveBatchRunner(CybCim, variable_parameters={"initial_trust": [0.2, 0.8],
+                                                              "global_seed_value": list(range(8))},
+                                 fixed_parameters={"num_firms": 4, "device_count": 10, "max_num_steps": 20},
+                                 max_steps=5, model_reporters={"compromised": get_total_compromised},
+                                 display_progress=False, min_replicates=2, wave_size=3, target_precision=1e-6)
+    runner.run_all()
+    run_ids = [key[-1] for key in runner.model_vars]
+    assert len(run_ids) == 16
+    assert len(set(run_ids)) == len(run_ids)
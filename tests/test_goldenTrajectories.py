@@ -0,0 +1,14 @@
+import os
+
+from goldenTrajectories import check_distribution, check_exact
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.npz")
+
+
+def test_agent_engine_matches_golden_trajectories():
+    assert check_exact(GOLDEN) == []
+
+
+def test_mean_field_engine_matches_golden_distributions():
+    failed = [row[:2] for row in check_distribution(GOLDEN, mean_field=True) if not row[-1]]
+    assert failed == []
@@ -0,0 +1,17 @@
+from headless import IMPORT_BUDGET, check_import_budget, measure_import, parse_parameters
+
+
+def test_headless_import_loads_no_heavy_module():
+    _, loaded = measure_import()
+    assert loaded == []
+
+
+def test_headless_import_within_budget():
+    assert check_import_budget(IMPORT_BUDGET) == []
+
+
+def test_parse_parameters_evaluates_literals_only():
+    params = parse_parameters(["device_count=20", "mean_field=True", "initial_trust=0.5", "name=abc",
+                               "target=__import__('os').getcwd()"])
+    assert params == {"device_count": 20, "mean_field": True, "initial_trust": 0.5, "name": "abc",
+                      "target": "__import__('os').getcwd()"}
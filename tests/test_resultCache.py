@@ -0,0 +1,12 @@
+import pytest
+
+from model import CybCim, get_total_compromised
+from resultCache import ResultCache
+
+
+def test_lambda_reporters_are_rejected(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache.key(CybCim, {"global_seed": True, "global_seed_value": 1}, 10)
+    assert cache.get(key, {"compromised": get_total_compromised}) is None
+    with pytest.raises(ValueError):
+        cache.get(key, {"compromised": lambda model: model.total_compromised})
@@ -0,0 +1,14 @@
+import pytest
+
+from statsHelpers import t_quantile
+
+# quantiles of Student's t distribution, from statistical tables
+QUANTILES = [(0.975, 3, 3.182446305284263), (0.995, 3, 5.840909309733352), (0.975, 4, 2.7764451051977987),
+             (0.995, 4, 4.604094871415897), (0.975, 5, 2.570581835636314), (0.995, 10, 3.16927267261695)]
+
+
+@pytest.mark.parametrize("p, df, expected", QUANTILES)
+def test_t_quantile(p, df, expected):
+    tolerance = 1e-9 if df <= 4 else 1e-3
+    assert t_quantile(p, df) == pytest.approx(expected, rel=tolerance)
+    assert t_quantile(1 - p, df) == pytest.approx(-expected, rel=tolerance)
@@ -0,0 +1,41 @@
+import signal
+import sqlite3
+import time
+
+from workQueue import DONE, FAILED, JobQueue, start_local_workers, submit_sweep
+
+
+def test_killed_worker_jobs_complete_exactly_once(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = JobQueue(path, lease_seconds=2)
+    submit_sweep(queue, {"global_seed_value": list(range(6))},
+                 {"global_seed": True, "num_firms": 4, "device_count": 10}, max_steps=300,
+                 model_reporters={"compromised": "get_total_compromised"})
+    workers = start_local_workers(path, 2, lease_seconds=2, poll_seconds=0.5)
+    try:
+        # kill a worker in the middle of a job
+        deadline = time.time() + 60
+        busy = []
+        while not busy:
+            assert time.time() < deadline
+            time.sleep(0.2)
+            busy = [pid for _, _, pid, _, job_id, _ in queue.workers() if job_id is not None]
+        killed = next(worker for worker in workers if worker.pid == busy[0])
+        killed.send_signal(signal.SIGKILL)
+        for worker in workers:
+            if worker is not killed:
+                assert worker.wait(120) == 0
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+
+    assert queue.progress()[DONE] == 6 and queue.progress()[FAILED] == 0
+    assert sorted(kwargs["global_seed_value"] for _, kwargs, _ in queue.results()) == list(range(6))
+    # every completion accepted by the queue is counted once, by the worker holding the job
+    assert sum(done for _, _, _, _, _, done in queue.workers()) == 6
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT MAX(attempts) FROM jobs").fetchone()[0] == 2  # the killed worker's job
+    finally:
+        conn.close()
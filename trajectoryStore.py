@@ -0,0 +1,233 @@
+import json
+import os
+import numpy as np
+
+# per-organization metrics that can be recorded, mapped to the organization attribute holding them
+# (same convention as the agent reporters of the batch runner)
+ORG_METRICS = {
+    "security": "security_budget",
+    "compromised": "num_compromised_new",
+    "info_known": "avg_info",
+    "free_loading": "free_loading_ratio",
+}
+
+META_FILE = "meta.json"
+MEMMAP_FILE = "trajectories.dat"
+
+
+class TrajectoryStore:
+    """
+    On-disk store of per-step, per-organization trajectories with a fixed (run, step, org, metric) layout.
+
+    The layout is decided when the store is created: number of runs, number of recorded steps, number of
+    organizations and the list of metrics. Steps can be downsampled at record time (`every`), in which case
+    row k of a run holds the state after model step (k + 1) * every.
+
+    Two backends are available:
+        - chunked (default): every run is split in chunks of `chunk_steps` rows, each chunk is stored in its own
+          compressed .npz file. Loading a slice only decompresses the chunks it overlaps.
+        - memmap (`compressed=False`): a single uncompressed memory-mapped array holding every run. Slices are
+          read straight from disk by the OS.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.num_runs = self.meta["num_runs"]
+        self.num_rows = self.meta["num_rows"]
+        self.num_firms = self.meta["num_firms"]
+        self.metrics = self.meta["metrics"]
+        self.every = self.meta["every"]
+        self.chunk_steps = self.meta["chunk_steps"]
+        self.compressed = self.meta["compressed"]
+        self.dtype = np.dtype(self.meta["dtype"])
+        self.shape = (self.num_runs, self.num_rows, self.num_firms, len(self.metrics))
+        self._memmap = None
+
+    @classmethod
+    def create(cls, path, num_runs, num_steps, num_firms, metrics=None, every=1, chunk_steps=100,
+               compressed=True, dtype="float32"):
+        """
+        Creates a new store at `path` and returns it.
+        :param num_runs: number of runs the store will hold
+        :param num_steps: number of model steps per run
+        :param num_firms: number of organizations per run
+        :param metrics: list of metric names from ORG_METRICS (all of them if None)
+        :param every: record only every n-th step (downsampling)
+        :param chunk_steps: number of recorded rows per chunk file (chunked backend only)
+        :param compressed: use the chunked compressed backend, else a single memory-mapped array
+        :param dtype: dtype of the stored values
+        """
+        if metrics is None:
+            metrics = list(ORG_METRICS.keys())
+        for metric in metrics:
+            if metric not in ORG_METRICS:
+                raise ValueError("Unknown organization metric: %s" % metric)
+        if every < 1 or chunk_steps < 1:
+            raise ValueError("every and chunk_steps must be positive")
+
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "num_runs": num_runs,
+            "num_steps": num_steps,
+            "num_rows": num_steps // every,
+            "num_firms": num_firms,
+            "metrics": list(metrics),
+            "every": every,
+            "chunk_steps": chunk_steps,
+            "compressed": compressed,
+            "dtype": np.dtype(dtype).name,
+        }
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+
+        store = cls(path)
+        if not compressed:
+            # allocate the whole file up front so that workers can write their runs concurrently
+            mm = np.memmap(store._memmap_path(), dtype=store.dtype, mode="w+", shape=store.shape)
+            mm[:] = np.nan
+            mm.flush()
+            del mm
+        return store
+
+    @property
+    def steps(self):
+        """Model step number corresponding to each recorded row."""
+        return (np.arange(self.num_rows) + 1) * self.every
+
+    def recorder(self, run):
+        """Returns a recorder writing the trajectories of run number `run` into this store."""
+        if not 0 <= run < self.num_runs:
+            raise IndexError("Run %d is out of range for a store of %d runs" % (run, self.num_runs))
+        return TrajectoryRecorder(self, run)
+
+    def load(self, runs=None, steps=None, orgs=None, metrics=None):
+        """
+        Lazily loads a slice of the store, reading only the chunks that overlap it.
+        :param runs: run index, slice or list of indices (all runs if None)
+        :param steps: row index, slice or list of row indices (all rows if None). A slice with a step
+                      downsamples at read time.
+        :param orgs: organization index, slice or list of indices (all organizations if None)
+        :param metrics: metric name or list of metric names (all metrics if None)
+        :return: array of shape (runs, rows, orgs, metrics). Rows that were never written are NaN.
+        """
+        run_idx = self._to_indices(runs, self.num_runs)
+        row_idx = self._to_indices(steps, self.num_rows)
+        org_idx = self._to_indices(orgs, self.num_firms)
+        if metrics is None:
+            metric_idx = np.arange(len(self.metrics))
+        else:
+            if isinstance(metrics, str):
+                metrics = [metrics]
+            metric_idx = np.array([self.metrics.index(m) for m in metrics], dtype=np.int64)
+
+        if not self.compressed:
+            mm = self._open_memmap("r")
+            return np.array(mm[np.ix_(run_idx, row_idx, org_idx, metric_idx)])
+
+        out = np.full((len(run_idx), len(row_idx), len(org_idx), len(metric_idx)), np.nan, dtype=self.dtype)
+        chunk_of_row = row_idx // self.chunk_steps
+        for r, run in enumerate(run_idx):
+            for chunk in np.unique(chunk_of_row):
+                data = self._read_chunk(run, chunk)
+                if data is None:
+                    continue
+                selected = np.nonzero(chunk_of_row == chunk)[0]
+                local = row_idx[selected] - chunk * self.chunk_steps
+                present = local < data.shape[0]  # last chunk of an unfinished run may be short
+                out[r, selected[present]] = data[np.ix_(local[present], org_idx, metric_idx)]
+        return out
+
+    def _to_indices(self, index, size):
+        if index is None:
+            return np.arange(size)
+        if isinstance(index, slice):
+            return np.arange(size)[index]
+        return np.atleast_1d(np.arange(size)[index])
+
+    def _chunk_path(self, run, chunk):
+        return os.path.join(self.path, "run%06d_chunk%06d.npz" % (run, chunk))
+
+    def _memmap_path(self):
+        return os.path.join(self.path, MEMMAP_FILE)
+
+    def _open_memmap(self, mode):
+        if mode != "r":
+            return np.memmap(self._memmap_path(), dtype=self.dtype, mode=mode, shape=self.shape)
+        if self._memmap is None:
+            self._memmap = np.memmap(self._memmap_path(), dtype=self.dtype, mode="r", shape=self.shape)
+        return self._memmap
+
+    def _read_chunk(self, run, chunk):
+        path = self._chunk_path(run, chunk)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as f:
+            return f["data"]
+
+    def _write_chunk(self, run, chunk, data):
+        # write to a temporary file first so a reader never sees a partially written chunk
+        path = self._chunk_path(run, chunk)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, data=data)
+        os.replace(tmp_path, path)
+
+    def __getstate__(self):
+        # memory maps are reopened in the process the store is sent to
+        state = self.__dict__.copy()
+        state["_memmap"] = None
+        return state
+
+
+class TrajectoryRecorder:
+    """
+    Streams the per-step organization metrics of a single model run into a TrajectoryStore.
+    Only one chunk of rows is held in memory at any time.
+
+    Attach it to a model with `model.trajectory_recorder = store.recorder(run)`; the model then calls
+    `record` after every step. `close` must be called at the end of the run to flush the last chunk.
+    """
+
+    def __init__(self, store, run):
+        self.store = store
+        self.run = run
+        self.attributes = [ORG_METRICS[m] for m in store.metrics]
+        self.row = 0
+        self.step = 0
+        self.closed = False
+        if store.compressed:
+            self.buffer = np.full((store.chunk_steps, store.num_firms, len(self.attributes)), np.nan,
+                                  dtype=store.dtype)
+            self.memmap = None
+        else:
+            self.buffer = None
+            self.memmap = store._open_memmap("r+")
+
+    def record(self, model):
+        self.step += 1
+        if self.step % self.store.every or self.row >= self.store.num_rows:
+            return
+        values = [[getattr(org, attribute) for attribute in self.attributes] for org in model.organizations]
+        if self.memmap is not None:
+            self.memmap[self.run, self.row] = values
+        else:
+            self.buffer[self.row % self.store.chunk_steps] = values
+            if (self.row + 1) % self.store.chunk_steps == 0:
+                self._flush_chunk(self.row // self.store.chunk_steps, self.store.chunk_steps)
+        self.row += 1
+
+    def _flush_chunk(self, chunk, num_rows):
+        self.store._write_chunk(self.run, chunk, self.buffer[:num_rows].copy())
+        self.buffer[:] = np.nan
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.memmap is not None:
+            self.memmap.flush()
+            self.memmap = None
+        elif self.row % self.store.chunk_steps:
+            # flush the partially filled last chunk
+            self._flush_chunk(self.row // self.store.chunk_steps, self.row % self.store.chunk_steps)
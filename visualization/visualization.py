@@ -1,4 +1,5 @@
 from mesa.visualization.ModularVisualization import VisualizationElement
+from mesa.visualization.modules import TextElement
 import re
 
 r1 = re.compile(r"\d+(px|%)")
@@ -184,3 +185,22 @@ class TabSelectorView(VisualizationElement):
         # return {"data": [e.render(model) for e in self.elements]}
         return [e.render(model) for e in self.elements]
 
+
+class SurrogatePredictionElement(TextElement):
+    """Predictions of a surrogate emulator (see surrogate.py) for the parameters of the current run."""
+
+    def __init__(self, surrogate):
+        super().__init__()
+        self.surrogate = surrogate
+        self.cache = (None, "")
+
+    def render(self, model):
+        params = getattr(model, "params", None)
+        if params is None:
+            return ""
+        key = repr(sorted(params.items()))
+        if self.cache[0] != key:  # the parameters only change when the model is reset
+            predictions = self.surrogate.predict(params)
+            text = ", ".join("%s %.3f &plusmn; %.3f" % (field, mean, std) for field, (mean, std) in predictions.items())
+            self.cache = (key, "Predicted after %d steps: %s" % (self.surrogate.steps, text))
+        return self.cache[1]
@@ -0,0 +1,367 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from itertools import product
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    kwargs TEXT,
+    max_steps INTEGER,
+    reporters TEXT,
+    status TEXT,
+    attempts INTEGER DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    progress INTEGER DEFAULT 0,
+    result BLOB,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started REAL,
+    heartbeat REAL,
+    job_id INTEGER,
+    jobs_done INTEGER DEFAULT 0
+);
+"""
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Durable job queue for model sweeps, stored in a single SQLite file.
+
+    Workers on this host, or on any host sharing the file system, claim jobs under a lease that they renew
+    with heartbeats while the model runs. A job whose lease expires (dead or stuck worker) is handed to the
+    next worker asking for one, until `max_attempts` is reached. A result is only accepted from the worker
+    currently holding the job, so killing or losing a worker never loses nor duplicates results.
+    """
+
+    def __init__(self, path, lease_seconds=60, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # autocommit mode, transactions are opened explicitly where several statements must be atomic
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def submit(self, kwargs_list, max_steps, model_reporters=None, agent_reporters=None):
+        """
+        Adds one job per parameter dictionary of `kwargs_list`. Jobs already in the queue are not added again.
+        :param model_reporters: label -> function of the `model` module (or its name)
+        :param agent_reporters: label -> organization attribute name
+        :return: the number of jobs added
+        """
+        reporters = json.dumps({
+            "model": {label: getattr(reporter, "__name__", reporter)
+                      for label, reporter in (model_reporters or {}).items()},
+            "agent": dict(agent_reporters or {}),
+        }, sort_keys=True)
+        added = 0
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for kwargs in kwargs_list:
+                encoded = json.dumps(kwargs, sort_keys=True)
+                key = hashlib.sha256((encoded + str(max_steps) + reporters).encode()).hexdigest()
+                cursor = conn.execute("INSERT OR IGNORE INTO jobs (key, kwargs, max_steps, reporters, status, "
+                                      "updated) VALUES (?, ?, ?, ?, ?, ?)",
+                                      (key, encoded, max_steps, reporters, PENDING, time.time()))
+                added += cursor.rowcount
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return added
+
+    def claim(self, worker_id):
+        """Leases the next available job to `worker_id`. Returns (job id, kwargs, max_steps, reporters) or None."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            while True:
+                row = conn.execute("SELECT id, kwargs, max_steps, reporters, attempts FROM jobs "
+                                   "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                                   (PENDING, RUNNING, now)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                job_id, kwargs, max_steps, reporters, attempts = row
+                if attempts >= self.max_attempts:  # timed out too many times
+                    conn.execute("UPDATE jobs SET status = ?, worker = NULL, error = ?, updated = ? WHERE id = ?",
+                                 (FAILED, "lease expired after %d attempts" % attempts, now, job_id))
+                    continue
+                conn.execute("UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                             "progress = 0, updated = ? WHERE id = ?",
+                             (RUNNING, worker_id, now + self.lease_seconds, now, job_id))
+                conn.execute("UPDATE workers SET job_id = ?, heartbeat = ? WHERE id = ?", (job_id, now, worker_id))
+                conn.execute("COMMIT")
+                return job_id, json.loads(kwargs), max_steps, json.loads(reporters)
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, worker_id, progress):
+        """Renews the lease of a job and records its progress. Returns False if the worker lost the job."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute("UPDATE jobs SET lease_expires = ?, progress = ?, updated = ? "
+                                  "WHERE id = ? AND worker = ? AND status = ?",
+                                  (now + self.lease_seconds, progress, now, job_id, worker_id, RUNNING))
+            conn.execute("UPDATE workers SET heartbeat = ? WHERE id = ?", (now, worker_id))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, job_id, worker_id, result):
+        """Stores the result of a job. Returns False (and drops the result) if the worker lost the job."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute("UPDATE jobs SET status = ?, result = ?, error = NULL, updated = ? "
+                                  "WHERE id = ? AND worker = ? AND status = ?",
+                                  (DONE, pickle.dumps(result), time.time(), job_id, worker_id, RUNNING))
+            accepted = cursor.rowcount == 1
+            if accepted:
+                conn.execute("UPDATE workers SET jobs_done = jobs_done + 1, job_id = NULL WHERE id = ?", (worker_id,))
+            conn.execute("COMMIT")
+            return accepted
+        finally:
+            conn.close()
+
+    def fail(self, job_id, worker_id, error):
+        """Gives a job back to the queue after an error, or marks it failed once it used all its attempts."""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, "
+                         "error = ?, updated = ? WHERE id = ? AND worker = ? AND status = ?",
+                         (self.max_attempts, FAILED, PENDING, error, time.time(), job_id, worker_id, RUNNING))
+        finally:
+            conn.close()
+
+    def register_worker(self, worker_id):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO workers (id, host, pid, started, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                         (worker_id, socket.gethostname(), os.getpid(), now, now))
+        finally:
+            conn.close()
+
+    def progress(self):
+        """Returns the number of jobs per status."""
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            conn.close()
+        return {status: counts.get(status, 0) for status in (PENDING, RUNNING, DONE, FAILED)}
+
+    def workers(self):
+        """Returns (worker id, host, pid, seconds since last heartbeat, current job, jobs done) for every worker."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT id, host, pid, heartbeat, job_id, jobs_done FROM workers").fetchall()
+        finally:
+            conn.close()
+        now = time.time()
+        return [(w, host, pid, now - heartbeat, job_id, done) for w, host, pid, heartbeat, job_id, done in rows]
+
+    def is_finished(self):
+        counts = self.progress()
+        return counts[PENDING] == 0 and counts[RUNNING] == 0
+
+    def results(self):
+        """Returns (job id, kwargs, (model_vars, agent_vars)) for every completed job."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT id, kwargs, result FROM jobs WHERE status = ? ORDER BY id",
+                                (DONE,)).fetchall()
+        finally:
+            conn.close()
+        return [(job_id, json.loads(kwargs), pickle.loads(result)) for job_id, kwargs, result in rows]
+
+    def get_model_vars_dataframe(self):
+        """ Generate a pandas DataFrame from the model-level variables of the completed jobs. """
+        import pandas as pd
+        records = []
+        for job_id, kwargs, (model_vars, _) in self.results():
+            record = dict(kwargs)
+            record["Run"] = job_id
+            record.update(model_vars)
+            records.append(record)
+        return pd.DataFrame(records)
+
+    def get_agent_vars_dataframe(self):
+        """ Generate a pandas DataFrame from the agent-level variables of the completed jobs. """
+        import pandas as pd
+        records = []
+        for job_id, kwargs, (_, agent_vars) in self.results():
+            for agent_id, reports in agent_vars.items():
+                record = dict(kwargs)
+                record["Run"] = job_id
+                record["AgentId"] = agent_id
+                record.update(reports)
+                records.append(record)
+        return pd.DataFrame(records)
+
+
+def submit_sweep(queue, variable_parameters, fixed_parameters=None, max_steps=1000,
+                 model_reporters=None, agent_reporters=None):
+    """Submits every combination of `variable_parameters` (updated with `fixed_parameters`), like the batch runner."""
+    names = list(variable_parameters.keys())
+    kwargs_list = []
+    for values in product(*[variable_parameters[name] for name in names]):
+        kwargs = dict(zip(names, values))
+        kwargs.update(fixed_parameters or {})
+        kwargs_list.append(kwargs)
+    return queue.submit(kwargs_list, max_steps, model_reporters, agent_reporters)
+
+
+class Worker:
+    """
+    Claims and runs jobs from a JobQueue until it is empty. While a model runs, a background thread renews the
+    job's lease every third of the lease duration; if the lease is lost the run is abandoned.
+
+    `job_timeout` is checked between the steps of the model, a run exceeding it fails with a TimeoutError. A step
+    can't be interrupted: once the timeout is exceeded the lease isn't renewed any more, so that the job of a
+    worker stuck in a step is handed to another worker when its lease expires.
+    """
+
+    def __init__(self, queue, poll_seconds=5, job_timeout=None, wait_for_jobs=False):
+        self.queue = queue
+        self.poll_seconds = poll_seconds
+        self.job_timeout = job_timeout
+        self.wait_for_jobs = wait_for_jobs
+        self.id = "%s-%d-%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+        self.progress = 0
+        self.lost_lease = threading.Event()
+        self.model = None  # model of the previous job, reset for the next one
+
+    def run(self):
+        self.queue.register_worker(self.id)
+        while True:
+            job = self.queue.claim(self.id)
+            if job is None:
+                if not self.wait_for_jobs and self.queue.is_finished():
+                    return
+                time.sleep(self.poll_seconds)
+                continue
+            self.run_job(*job)
+
+    def run_job(self, job_id, kwargs, max_steps, reporters):
+        self.progress = 0
+        self.lost_lease.clear()
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.simulate(kwargs, max_steps, reporters)
+        except Exception:
+            done.set()
+            heartbeat.join()
+            self.queue.fail(job_id, self.id, traceback.format_exc())
+            return
+        done.set()
+        heartbeat.join()
+        if result is not None:
+            self.queue.complete(job_id, self.id, result)
+
+    def _heartbeat(self, job_id, done):
+        started = time.time()
+        while not done.wait(self.queue.lease_seconds / 3):
+            if self.job_timeout is not None and time.time() - started > self.job_timeout:
+                return  # stuck in a step, let the lease expire
+            if not self.queue.heartbeat(job_id, self.id, self.progress):
+                self.lost_lease.set()
+                return
+
+    def simulate(self, kwargs, max_steps, reporters):
+        """Runs one model. Returns (model_vars, agent_vars), or None if the job was lost to another worker."""
+        import headless
+        import model as model_module
+        started = time.time()
+        model = self.model = headless.make_model(self.model, **kwargs)
+        try:
+            while model.running and model.schedule.steps < max_steps:
+                if self.lost_lease.is_set():
+                    return None
+                if self.job_timeout is not None and time.time() - started > self.job_timeout:
+                    raise TimeoutError("job did not finish within %s seconds" % self.job_timeout)
+                model.step()
+                self.progress = model.schedule.steps
+
+            model_vars = {label: getattr(model_module, name)(model)
+                          for label, name in reporters["model"].items()}
+            agent_vars = {}
+            for org in model.organizations:
+                agent_vars[org.unique_id] = {label: getattr(org, attribute)
+                                             for label, attribute in reporters["agent"].items()}
+            return model_vars, agent_vars
+        finally:
+            model.close()  # the model is reset for the next job
+
+
+def start_local_workers(path, count, lease_seconds=60, max_attempts=3, poll_seconds=5):
+    """Starts `count` worker processes on this host working on the queue at `path`. Returns their Popen objects."""
+    script = os.path.abspath(__file__)
+    return [subprocess.Popen([sys.executable, script, "worker", path, "--lease", str(lease_seconds),
+                              "--max-attempts", str(max_attempts), "--poll", str(poll_seconds)],
+                             cwd=os.path.dirname(script))
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Work queue for multi-host CybCim sweeps")
+    subparsers = parser.add_subparsers(dest="command")
+    worker_parser = subparsers.add_parser("worker", help="run jobs from a queue until it is empty")
+    worker_parser.add_argument("queue", help="path of the SQLite queue file")
+    worker_parser.add_argument("--lease", type=float, default=60, help="lease duration in seconds")
+    worker_parser.add_argument("--max-attempts", type=int, default=3)
+    worker_parser.add_argument("--poll", type=float, default=5, help="seconds between polls of an idle queue")
+    worker_parser.add_argument("--timeout", type=float, default=None, help="maximum run time of a job in seconds")
+    worker_parser.add_argument("--wait", action="store_true", help="keep polling once the queue is empty")
+    status_parser = subparsers.add_parser("status", help="print the progress of a queue")
+    status_parser.add_argument("queue", help="path of the SQLite queue file")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        queue = JobQueue(args.queue, lease_seconds=args.lease, max_attempts=args.max_attempts)
+        Worker(queue, poll_seconds=args.poll, job_timeout=args.timeout, wait_for_jobs=args.wait).run()
+    elif args.command == "status":
+        queue = JobQueue(args.queue)
+        print(queue.progress())
+        for worker in queue.workers():
+            print("%s on %s (pid %d): last heartbeat %.0fs ago, job %s, %d jobs done" % worker)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()